@@ -0,0 +1,110 @@
+"""This module extracts the doctors that dictated and signed the reports in batch and indexes the reports by them, so
+that the reports of a given resident or attending can be found without scanning the whole corpus."""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from src.report_index import build_inverted_index, intersect_positions
+from src.report_manager import Report
+
+
+def extract_authors(texts: pd.Series | list[str]) -> pd.DataFrame:
+    """Extracts the dictator and the signer of many reports at once.
+
+    This is the vectorized version of `Report.get_authors`.
+
+    Args:
+        texts: Lowercase texts of the reports.
+
+    Returns:
+        A Dataframe with the columns "dictator" and "signer", aligned with the input texts. Authors that can't be found
+        are missing values.
+
+    """
+    texts = pd.Series(texts, dtype=object)
+
+    # Everything after the first electronic signature token, with the whitespaces normalized like the bigram walk of
+    # Report.get_electronic_signature does
+    electronic_signature = (texts.str.partition(Report.electronic_signature_token)[2]
+                            .str.replace(r"\s+", " ", regex=True))
+
+    signer = electronic_signature.str.extract(Report.signer_pattern, expand=False).str.strip()
+    dictator = electronic_signature.str.extract(Report.dictator_pattern, expand=False).str.strip()
+
+    # Case 1: same author
+    same_author = electronic_signature.str.contains(Report.same_author_token, regex=False)
+    dictator = dictator.mask(same_author, signer)
+
+    return pd.DataFrame({"dictator": dictator, "signer": signer}, index=texts.index)
+
+
+class AuthorIndex:
+    """Inverted index from the dictators and signers to the positions of their reports.
+
+    Attributes:
+        authors: Dataframe with the dictator and signer of each report, as returned by `extract_authors`.
+
+    """
+    def __init__(self, authors: pd.DataFrame) -> None:
+        """Initializes an AuthorIndex object."""
+        self.authors = authors.reset_index(drop=True)
+        self._positions = {col: build_inverted_index(self.authors[col]) for col in ("dictator", "signer")}
+
+    @classmethod
+    def from_reports(cls, reports: list[Report]) -> AuthorIndex:
+        """Builds the index of a list of reports.
+
+        Args:
+            reports: Reports to index.
+
+        Returns:
+            The index.
+
+        """
+        return cls(extract_authors([x.text for x in reports]))
+
+    @property
+    def dictators(self) -> list[str]:
+        """Gets all the doctors that dictated at least one report."""
+        return sorted(self._positions["dictator"])
+
+    @property
+    def signers(self) -> list[str]:
+        """Gets all the doctors that signed at least one report."""
+        return sorted(self._positions["signer"])
+
+    def get_positions(self, dictator: str | None = None, signer: str | None = None) -> np.ndarray:
+        """Gets the positions of the reports dictated and/or signed by the given doctors.
+
+        Args:
+            dictator: Name of the doctor that dictated the reports, e.g. "attending peter riviello md".
+            signer: Name of the doctor that signed the reports.
+
+        Returns:
+            A sorted array with the positions of the reports.
+
+        """
+        return intersect_positions([self._positions[col].get(name.strip().lower(), np.array([], dtype=np.int64))
+                                    for col, name in (("dictator", dictator), ("signer", signer)) if name is not None],
+                                   len(self.authors))
+
+    def get_reports(self, reports: list[Report], dictator: str | None = None, signer: str | None = None,
+                    body_section: str | None = None) -> list[Report]:
+        """Gets the reports dictated and/or signed by the given doctors.
+
+        Args:
+            reports: The reports used to build the index.
+            dictator: Name of the doctor that dictated the reports.
+            signer: Name of the doctor that signed the reports.
+            body_section: If given, only the reports of the given body section are returned.
+
+        Returns:
+            A list of Report objects.
+
+        """
+        selected = [reports[i] for i in self.get_positions(dictator, signer)]
+        if body_section is not None:
+            selected = [x for x in selected if x.body_section == body_section]
+
+        return selected
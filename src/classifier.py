@@ -0,0 +1,260 @@
+"""This module contains a learned pathology labeler: a linear classifier trained on sparse n-gram features of the
+reports that already have a pathology assigned by a medical expert (i.e. the ground truth pathology).
+
+Unlike the exact and fuzzy matchers, this labeler does not need spaCy at inference time.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable
+from copy import deepcopy
+from pathlib import Path
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import SGDClassifier
+
+from src.const.pathologies import Pathology
+from src.report_manager import Report
+
+
+class PathologyClassifier:
+    """Linear classifier that predicts the pathology of a report from its text.
+
+    Two types of features can be used:
+        - "tfidf": TF-IDF weighted n-grams. The vocabulary is learned during the first call to `fit`.
+        - "hashing": Hashed n-grams. No vocabulary has to be learned, so the model can be trained out-of-core by
+          streaming batches of reports to `partial_fit`.
+
+    The linear model is trained with stochastic gradient descent, so it can be trained incrementally too.
+
+    Attributes:
+        vectorizer_type: Type of features, either "tfidf" or "hashing".
+        look_in: Text the classifier is trained on and predicts from. Either "impression" or "report".
+        threshold: Minimum probability needed to accept a prediction. Predictions below it are set to unknown.
+        vectorizer: The scikit-learn vectorizer that computes the sparse features.
+        model: The scikit-learn linear model.
+
+    """
+    def __init__(self, vectorizer_type: str = "tfidf", look_in: str = "impression",
+                 ngram_range: tuple[int, int] = (1, 2), n_features: int = 2 ** 20, threshold: float = 0.0,
+                 random_state: int = 123) -> None:
+        """Initializes a PathologyClassifier object.
+
+        Args:
+            vectorizer_type: Type of features, either "tfidf" or "hashing".
+            look_in: Text to train on and predict from. Either "impression" to look only in the impression section or
+                "report" to look in the whole report.
+            ngram_range: Range of word n-grams used as features.
+            n_features: Number of features of the hashing vectorizer. Ignored for "tfidf".
+            threshold: Minimum probability needed to accept a prediction.
+            random_state: Seed of the linear model.
+
+        """
+        if vectorizer_type == "tfidf":
+            self.vectorizer = TfidfVectorizer(ngram_range=ngram_range, sublinear_tf=True, dtype=np.float32)
+        elif vectorizer_type == "hashing":
+            self.vectorizer = HashingVectorizer(ngram_range=ngram_range, n_features=n_features, alternate_sign=False,
+                                                dtype=np.float32)
+        else:
+            raise ValueError(f"vectorizer_type must be 'tfidf' or 'hashing'")
+
+        self.vectorizer_type = vectorizer_type
+        self.look_in = look_in
+        self.threshold = threshold
+        self.model = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=random_state)
+
+        self._is_vectorizer_fitted = vectorizer_type == "hashing"
+
+    @property
+    def _is_model_fitted(self) -> bool:
+        """Checks whether the linear model has been trained on at least one report."""
+        return hasattr(self.model, "classes_")
+
+    @property
+    def classes(self) -> list[str]:
+        """Gets the pathologies the classifier can predict."""
+        return self.model.classes_.tolist()
+
+    def fit(self, reports: list[Report]) -> PathologyClassifier:
+        """Trains the classifier from scratch on the reports that have a ground truth pathology.
+
+        Args:
+            reports: Reports to train on. Reports without ground truth pathology are ignored.
+
+        Returns:
+            The classifier itself.
+
+        """
+        texts, y = self._get_training_data(reports)
+        if not texts:
+            raise ValueError("None of the reports has a ground truth pathology")
+
+        if self.vectorizer_type == "tfidf":
+            x = self.vectorizer.fit_transform(texts)
+            self._is_vectorizer_fitted = True
+        else:
+            x = self.vectorizer.transform(texts)
+
+        self.model.fit(x, y)
+
+        return self
+
+    def partial_fit(self, reports: list[Report], classes: list[str] | None = None) -> PathologyClassifier:
+        """Trains the classifier incrementally on a batch of reports that have a ground truth pathology.
+
+        With "tfidf" features, the vectorizer must have been fitted before with `fit`. Batches without any report with
+        ground truth pathology are skipped.
+
+        Args:
+            reports: Batch of reports to train on. Reports without ground truth pathology are ignored.
+            classes: All the pathologies that can appear across all batches. Only required on the first call that is
+                not skipped.
+
+        Returns:
+            The classifier itself.
+
+        """
+        if not self._is_vectorizer_fitted:
+            raise ValueError("The TF-IDF vectorizer has not been fitted. Call 'fit' first or use hashing features.")
+
+        texts, y = self._get_training_data(reports)
+        if not texts:
+            return self
+
+        x = self.vectorizer.transform(texts)
+
+        if classes is not None:
+            classes = [c.lower() for c in classes]
+        self.model.partial_fit(x, y, classes=classes)
+
+        return self
+
+    def fit_stream(self, report_batches: Iterable[list[Report]], classes: list[str]) -> PathologyClassifier:
+        """Trains the classifier out-of-core on a stream of batches of reports.
+
+        Batches without any report with ground truth pathology (e.g. a body section not annotated yet) are skipped,
+        but at least one report of the stream must have one.
+
+        Args:
+            report_batches: Batches of reports to train on, e.g. the body sections of the SDR loaded one at a time.
+            classes: All the pathologies that can appear across all batches.
+
+        Returns:
+            The classifier itself.
+
+        """
+        for batch in report_batches:
+            # The classes are given until the first batch that is not skipped
+            self.partial_fit(batch, classes if not self._is_model_fitted else None)
+
+        if not self._is_model_fitted:
+            raise ValueError("None of the reports has a ground truth pathology")
+
+        return self
+
+    def predict(self, texts: list[str], batch_size: int = 1024) -> list[str]:
+        """Predicts the pathology of each text in batches.
+
+        Args:
+            texts: Texts to label.
+            batch_size: Number of texts vectorized and classified at the same time.
+
+        Returns:
+            A list with the predicted pathologies. The unknown pathology is returned as Pathology.unknown, even though
+            the ground truth pathologies are lowercased.
+
+        """
+        preds = []
+        for start in range(0, len(texts), batch_size):
+            x = self.vectorizer.transform(texts[start:start + batch_size])
+
+            if self.threshold > 0:
+                proba = self.model.predict_proba(x)
+                best = proba.argmax(axis=1)
+                batch_preds = np.where(proba[np.arange(len(best)), best] >= self.threshold,
+                                       self.model.classes_[best], Pathology.unknown)
+            else:
+                batch_preds = self.model.predict(x)
+
+            # The ground truth pathologies are lowercased by the Report class, so the unknown pathology is mapped back
+            batch_preds = np.where(batch_preds == Pathology.unknown.lower(), Pathology.unknown, batch_preds)
+
+            preds.extend(batch_preds.tolist())
+
+        return preds
+
+    def save(self, path: str | Path) -> None:
+        """Saves the fitted classifier to disk.
+
+        Args:
+            path: Path to the output file.
+
+        """
+        path = Path(path).resolve()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        joblib.dump(self, path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> PathologyClassifier:
+        """Loads a fitted classifier from disk.
+
+        Args:
+            path: Path to the file saved with `save`.
+
+        Returns:
+            The classifier.
+
+        """
+        classifier = joblib.load(Path(path).resolve())
+        if not isinstance(classifier, cls):
+            raise TypeError(f"{path} does not contain a {cls.__name__}")
+
+        return classifier
+
+    def _get_training_data(self, reports: list[Report]) -> tuple[list[str], list[str]]:
+        """Gets the texts and ground truth pathologies of the reports that have been labeled. Both lists are empty if
+        none has been labeled."""
+        labeled_reports = [x for x in reports if x.gt_pathology is not None]
+
+        texts = [x.get_text(self.look_in) for x in labeled_reports]
+        y = [x.gt_pathology for x in labeled_reports]
+
+        return texts, y
+
+
+def classifier_match(reports: list[Report], classifier: PathologyClassifier, batch_size: int = 1024) -> list[Report]:
+    """Finds the pathology of each report using a trained classifier.
+
+    The classifier looks in the same text it was trained on.
+
+    Args:
+        reports: Reports to label.
+        classifier: Fitted classifier.
+        batch_size: Number of reports classified at the same time.
+
+    Returns:
+        A list of Report objects with the predicted pathologies.
+
+    """
+    reports_copy = deepcopy(reports)
+
+    texts = [x.get_text(classifier.look_in) for x in reports_copy]
+    preds = classifier.predict(texts, batch_size)
+    for report, pred in zip(reports_copy, preds):
+        report.pred_pathology = pred
+
+    return reports_copy
+
+
+if __name__ == '__main__':
+    from src.const.body_sections import BodySection
+    from src.data_preparation.loaders import load_reports_with_impression
+
+    reports_, _ = load_reports_with_impression("src/data_preparation/data/merged_crosswalks_csv/sdr_crosswalks.csv",
+                                               body_section=BodySection.MSK)
+
+    classifier_ = PathologyClassifier(vectorizer_type="hashing").fit(reports_)
+    classifier_.save("src/models/pathology_classifier.joblib")
+
+    preds_classifier = classifier_match(reports_, PathologyClassifier.load("src/models/pathology_classifier.joblib"))
@@ -0,0 +1,235 @@
+"""This module compares several configurations of the matchers on the same reports.
+
+Instead of running each configuration independently, an execution plan shares all the work that doesn't depend on the
+configuration: each section of each report is extracted once, the fuzzy scores are computed once per section for all
+thresholds, and each text is parsed by the spacy model once, only if some configuration needs to check a negation in it.
+"""
+from __future__ import annotations
+
+from copy import deepcopy
+from typing import TYPE_CHECKING, NamedTuple
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from src.const.pathologies import Pathology
+from src.evaluation import encode_labels, evaluate_arrays, get_classes
+from src.main import find_exact_label, is_pathology_negated_in_doc
+from src.nlp_models import get_nlp_model
+from src.report_manager import Report
+
+if TYPE_CHECKING:
+    import spacy
+
+
+class MatcherConfig(NamedTuple):
+    """Configuration of a matcher.
+
+    Attributes:
+        method: Matcher to use. Either "exact" or "fuzzy".
+        look_in: Text to look in. Either "impression" or "report".
+        threshold: Threshold for the fuzzy match. Ignored by the exact match.
+        check_synonyms: If True, the synonyms of the pathologies are checked. Ignored by the fuzzy match.
+
+    """
+    method: str
+    look_in: str = "impression"
+    threshold: float = 80.0
+    check_synonyms: bool = False
+
+    @property
+    def name(self) -> str:
+        """Gets a readable name of the configuration. The parameters that the method ignores are not in the name, so
+        configurations that only differ in those have the same name."""
+        if self.method == "fuzzy":
+            return f"fuzzy_{self.look_in}_{self.threshold:g}"
+
+        return f"exact_{self.look_in}" + ("_synonyms" if self.check_synonyms else "")
+
+
+def run_configs(reports: list[Report], labels: list[str], configs: list[MatcherConfig],
+                synonyms_dict: dict[str, list[str]] | None = None,
+                nlp: spacy.language.Language | None = None) -> dict[str, list[str]]:
+    """Finds the pathology of each report with each configuration, sharing the work between them.
+
+    The predictions are the same as running `exact_match` or `fuzzy_match` with each configuration.
+
+    Args:
+        reports: Reports to label.
+        labels: Possible pathology labels.
+        configs: Configurations to run. Their names must be different.
+        synonyms_dict: Dictionary from a label to its synonyms. Required if any configuration checks synonyms.
+        nlp: Spacy model used to detect negations. If None, the model is loaded.
+
+    Returns:
+        A dictionary from the name of each configuration to the list of predicted pathologies.
+
+    """
+    # The results are keyed by name, so a repeated name would overwrite the results of another configuration
+    names = [x.name for x in configs]
+    repeated = sorted({x for x in names if names.count(x) > 1})
+    if repeated:
+        raise ValueError(f"The configurations must have different names, but these are repeated: {repeated}")
+
+    for config in configs:
+        if config.method not in ("exact", "fuzzy"):
+            raise ValueError(f"method must be 'exact' or 'fuzzy'")
+        if config.method == "exact" and config.check_synonyms and synonyms_dict is None:
+            raise ValueError("synonyms_dict must be given to check synonyms")
+
+    # 1. Extract each section once
+    texts = {look_in: [x.get_text(look_in) for x in reports] for look_in in {x.look_in for x in configs}}
+
+    # 2. Find the candidate label of each report for each configuration. A candidate is (label position, whether it
+    # needs a negation check). Exact candidates are shared by the configurations with the same section and synonyms,
+    # and fuzzy scores by the configurations with the same section.
+    exact_candidates = {}
+    fuzzy_scores = {}
+    candidates = {}
+    for config in configs:
+        section_texts = texts[config.look_in]
+        if config.method == "exact":
+            key = (config.look_in, config.check_synonyms)
+            if key not in exact_candidates:
+                synonyms = synonyms_dict if config.check_synonyms else None
+                exact_candidates[key] = [_exact_candidate(x, labels, synonyms) for x in section_texts]
+            candidates[config.name] = exact_candidates[key]
+        else:
+            if config.look_in not in fuzzy_scores:
+                fuzzy_scores[config.look_in] = _fuzzy_scores(section_texts, labels)
+            candidates[config.name] = _fuzzy_candidates(fuzzy_scores[config.look_in], config.threshold)
+
+    # 3. Check each negation once, parsing each text once
+    pending = {(config.look_in, i, c[0]) for config in configs for i, c in enumerate(candidates[config.name])
+               if c is not None and c[1]}
+    negations = _check_negations(pending, texts, labels, nlp)
+
+    # 4. Assign the predictions
+    preds = {}
+    for config in configs:
+        config_preds = []
+        for i, c in enumerate(candidates[config.name]):
+            if c is None or (c[1] and negations[(config.look_in, i, c[0])]):
+                config_preds.append(Pathology.unknown)
+            else:
+                config_preds.append(labels[c[0]])
+        preds[config.name] = config_preds
+
+    return preds
+
+
+def compare_configs(reports: list[Report], labels: list[str], configs: list[MatcherConfig],
+                    synonyms_dict: dict[str, list[str]] | None = None,
+                    nlp: spacy.language.Language | None = None) -> pd.DataFrame:
+    """Runs several configurations and compares them side by side.
+
+    Args:
+        reports: Reports to label.
+        labels: Possible pathology labels.
+        configs: Configurations to run. Their names must be different.
+        synonyms_dict: Dictionary from a label to its synonyms. Required if any configuration checks synonyms.
+        nlp: Spacy model used to detect negations. If None, the model is loaded.
+
+    Returns:
+        A Dataframe indexed by configuration name with the configuration, the number of unknown predictions and the
+        other summary metrics (see `evaluate_arrays`).
+
+    """
+    preds = run_configs(reports, labels, configs, synonyms_dict, nlp)
+
+    # The ground truth is encoded only once for all the configurations
+    gt = [x.gt_pathology for x in reports]
+    classes = get_classes(labels, gt)
+    gt_idx = encode_labels(gt, classes)
+    unknown_idx = classes.index(Pathology.unknown.lower())
+
+    rows = {}
+    for config in configs:
+        metrics = evaluate_arrays(gt_idx, encode_labels(preds[config.name], classes), unknown_idx)
+        rows[config.name] = {**config._asdict(), **metrics}
+
+    return pd.DataFrame.from_dict(rows, orient="index").rename_axis("config")
+
+
+def apply_predictions(reports: list[Report], preds: list[str]) -> list[Report]:
+    """Returns a copy of the reports with the given predicted pathologies.
+
+    Args:
+        reports: Reports that were labeled.
+        preds: Predicted pathologies of one configuration, as returned by `run_configs`.
+
+    Returns:
+        A list of Report objects with the predicted pathologies.
+
+    """
+    reports_copy = deepcopy(reports)
+    for report, pred in zip(reports_copy, preds):
+        report.pred_pathology = pred
+
+    return reports_copy
+
+
+def _exact_candidate(text: str, labels: list[str],
+                     synonyms_dict: dict[str, list[str]] | None) -> tuple[int, bool] | None:
+    """Gets the candidate label of the exact match. Only labels found directly (not through a synonym) are checked
+    for negation."""
+    label_idx, is_synonym = find_exact_label(text, labels, synonyms_dict)
+
+    return (label_idx, not is_synonym) if label_idx is not None else None
+
+
+def _fuzzy_scores(texts: list[str], labels: list[str]) -> np.ndarray:
+    """Computes the partial ratio of each label in each text, as in `fuzzy_match`.
+
+    Returns:
+        An array of shape (n_texts, n_labels).
+
+    """
+    return process.cdist(labels, texts, scorer=fuzz.partial_ratio, dtype=np.float64, workers=-1).T
+
+
+def _fuzzy_candidates(scores: np.ndarray, threshold: float) -> list[tuple[int, bool] | None]:
+    """Gets the candidate labels of the fuzzy match: the highest score of each text if it is above the threshold. In
+    case of draw, the first label is taken."""
+    if scores.shape[1] == 0:
+        return [None] * len(scores)
+
+    max_idx = scores.argmax(axis=1)
+    above = scores[np.arange(len(scores)), max_idx] > threshold
+
+    return [(int(i), True) if is_above else None for i, is_above in zip(max_idx, above)]
+
+
+def _check_negations(pending: set[tuple[str, int, int]], texts: dict[str, list[str]], labels: list[str],
+                     nlp: spacy.language.Language | None) -> dict[tuple[str, int, int], bool]:
+    """Checks whether the labels are negated in the texts.
+
+    Args:
+        pending: Set of (section, text position, label position) to check.
+        texts: Texts of each section.
+        labels: Possible pathology labels.
+        nlp: Spacy model. If None, the model is loaded only if there is something to check.
+
+    Returns:
+        A dictionary from each pending check to whether the label is negated.
+
+    """
+    if not pending:
+        return {}
+
+    if nlp is None:
+        nlp = get_nlp_model()
+
+    # The same text (e.g. a report without impression in both sections) is only parsed once, and each document is
+    # discarded as soon as its negations are checked
+    checks_by_text = {}
+    for look_in, i, j in pending:
+        checks_by_text.setdefault(texts[look_in][i], []).append((look_in, i, j))
+
+    negations = {}
+    for doc, checks in zip(nlp.pipe(checks_by_text), checks_by_text.values()):
+        for look_in, i, j in checks:
+            negations[(look_in, i, j)] = is_pathology_negated_in_doc(labels[j], doc)
+
+    return negations
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import inspect
+from functools import lru_cache
 
 
 class BodySection:
@@ -15,9 +16,26 @@ class BodySection:
     PEDS = "PEDS"
 
     @classmethod
+    @lru_cache()
+    def get_sections(cls) -> tuple[str, ...]:
+        """Returns all the body sections.
+
+        The members are only inspected the first time this method is called.
+
+        Returns:
+            A tuple with all the body sections.
+
+        """
+        return tuple(x[1] for x in inspect.getmembers(cls)
+                     if not x[0].startswith("_") and not inspect.ismethod(x[1]))
+
+    @classmethod
+    @lru_cache()
     def get_section(cls, text: str) -> str:
         """Given a string, returns the body section it belongs to.
 
+        The result is cached, since this is called with the same few filenames for all the reports.
+
         Args:
             text: String that could contain a body section.
 
@@ -25,11 +43,9 @@ class BodySection:
             Either the body section or an empty string if no body section was found.
 
         """
-        members = {x[0]:x[1] for x in inspect.getmembers(cls)
-                   if not x[0].startswith("__") and not inspect.ismethod(x[1])}
-        for k, v in members.items():
-            if v.lower() in text.lower():
-                return v
+        text = text.lower()
+        for section in cls.get_sections():
+            if section.lower() in text:
+                return section
 
         return ""
-
@@ -0,0 +1,6 @@
+class PipelineProfile:
+    """Named sets of components of the spacy model, so that each task only loads what it needs."""
+    FULL = "full"
+    NEGATION = "negation"
+    LEMMA = "lemma"
+    TOKENIZER = "tokenizer"
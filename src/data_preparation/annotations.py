@@ -0,0 +1,191 @@
+"""
+This module brings the pathologies chosen by the medical experts in the annotation tool (Label Studio) back into the
+reports as their ground truth pathology.
+
+The exports are streamed record by record and joined onto the reports through a hash index of the accession numbers,
+so the cost scales with the size of the export and not with the size of the corpus.
+"""
+from __future__ import annotations
+
+import json
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import pandas as pd
+
+from src.report_index import ACCESSION_FIELDS, AccessionIndex
+from src.report_manager import Report
+
+
+def iter_label_studio_annotations(data_path: str | Path, label_column: str = "choice",
+                                  chunk_size: int = 10000) -> Iterator[tuple[dict, str | None]]:
+    """Streams the annotations of a Label Studio export.
+
+    The JSON export (tasks with their annotations), the JSON-MIN export and the CSV export are supported.
+
+    Args:
+        data_path: Path to the exported JSON or CSV file.
+        label_column: Name of the choices control of the labeling interface. In the JSON-MIN and CSV exports, it is the
+            name of the field with the chosen pathology.
+        chunk_size: Number of rows read at the same time from a CSV file.
+
+    Yields:
+        A tuple with a dictionary of the accession numbers of the annotated report and the chosen pathology (None if
+        the report has no annotation).
+
+    """
+    data_path = Path(data_path).resolve()
+
+    if data_path.suffix.lower() == ".json":
+        for task in _iter_json_array(data_path):
+            data = task.get("data", task)
+            yield {x: data.get(x) for x in ACCESSION_FIELDS}, _get_task_label(task, label_column)
+    elif data_path.suffix.lower() == ".csv":
+        for chunk in pd.read_csv(data_path, chunksize=chunk_size, dtype=str):
+            chunk = chunk.astype(object).where(chunk.notna(), None)
+            columns = [x for x in ACCESSION_FIELDS if x in chunk.columns]
+            labels = chunk[label_column] if label_column in chunk.columns else [None] * len(chunk)
+            for accessions, label in zip(chunk[columns].to_dict("records"), labels):
+                yield accessions, label
+    else:
+        raise ValueError(f"Label Studio exports must be JSON or CSV files, not {data_path.suffix}")
+
+
+def join_annotations(reports: list[Report], annotations: Iterable[tuple[dict, str | None]],
+                     index: AccessionIndex | None = None) -> tuple[int, int]:
+    """Assigns the annotated pathologies to the reports as their ground truth pathology.
+
+    This function changes the report objects in-place.
+
+    Args:
+        reports: Reports to assign the annotations to.
+        annotations: Accession numbers and pathology of each annotation, as yielded by `iter_label_studio_annotations`.
+        index: Accession index of the reports. If None, it is built.
+
+    Returns:
+        A tuple with the number of annotations joined and the number of annotations whose report was not found.
+
+    """
+    if index is None:
+        index = AccessionIndex.from_reports(reports)
+
+    n_joined = n_not_found = 0
+    for accessions, label in annotations:
+        if label is None:
+            continue
+
+        positions = index.find(accessions)
+        if not len(positions):
+            n_not_found += 1
+            continue
+
+        for i in positions:
+            reports[i].gt_pathology = label.lower()
+        n_joined += 1
+
+    return n_joined, n_not_found
+
+
+def load_label_studio_annotations(reports: list[Report], data_path: str | Path, label_column: str = "choice",
+                                  index: AccessionIndex | None = None) -> tuple[int, int]:
+    """Loads a Label Studio export and assigns its pathologies to the reports as their ground truth pathology.
+
+    Args:
+        reports: Reports to assign the annotations to.
+        data_path: Path to the exported JSON or CSV file.
+        label_column: Name of the choices control of the labeling interface.
+        index: Accession index of the reports. If None, it is built.
+
+    Returns:
+        A tuple with the number of annotations joined and the number of annotations whose report was not found.
+
+    """
+    n_joined, n_not_found = join_annotations(reports, iter_label_studio_annotations(data_path, label_column), index)
+
+    print(f"Number of annotations joined: {n_joined}")
+    print(f"Number of annotations whose report was not found: {n_not_found}")
+
+    return n_joined, n_not_found
+
+
+def _get_task_label(task: dict, label_column: str) -> str | None:
+    """Gets the chosen pathology of a task of a JSON or JSON-MIN export."""
+    # JSON-MIN export: the choice is a field of the task
+    if "annotations" not in task:
+        label = task.get(label_column)
+        if isinstance(label, dict):
+            label = label.get("choices")
+        if isinstance(label, list):
+            label = label[0] if label else None
+        return label or None
+
+    # JSON export: the choice is in the results of the last annotation that was not cancelled. If there is no choices
+    # control with the given name, the first choices control is used
+    for annotation in reversed(task["annotations"]):
+        if annotation.get("was_cancelled"):
+            continue
+
+        choices = [x for x in annotation.get("result", []) if x.get("type") == "choices"]
+        choices.sort(key=lambda x: x.get("from_name") != label_column)
+        for result in choices:
+            values = result.get("value", {}).get("choices", [])
+            if values:
+                return values[0]
+
+    return None
+
+
+def _iter_json_array(data_path: Path, chunk_size: int = 1 << 20) -> Iterator[dict]:
+    """Streams the elements of a JSON file with an array at the top level without loading the whole file."""
+    decoder = json.JSONDecoder()
+
+    with open(data_path, encoding="utf-8") as f:
+        # The elements are decoded in place from an offset, and the buffer is only trimmed when a chunk is read
+        buffer = ""
+        idx = 0
+        started = False
+        eof = False
+        while True:
+            idx = _skip_separators(buffer, idx, started)
+
+            if idx < len(buffer):
+                if not started:
+                    if buffer[idx] != "[":
+                        raise ValueError(f"{data_path} does not contain a JSON array")
+                    started = True
+                    idx += 1
+                    continue
+
+                if buffer[idx] == "]":
+                    return
+
+                try:
+                    element, idx_end = decoder.raw_decode(buffer, idx)
+                except json.JSONDecodeError:
+                    # The element is not complete yet
+                    pass
+                else:
+                    # An element that reaches the end of the buffer (e.g. a number) may continue in the next chunk
+                    if idx_end < len(buffer) or eof:
+                        yield element
+                        idx = idx_end
+                        continue
+
+            if eof:
+                if not started:
+                    return
+                raise ValueError(f"{data_path} ended before the end of the JSON array")
+
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[idx:] + chunk
+            idx = 0
+
+
+def _skip_separators(buffer: str, idx: int, started: bool) -> int:
+    """Skips the whitespace and, inside the array, the commas between the elements of a JSON array."""
+    separators = " \t\n\r," if started else " \t\n\r"
+    while idx < len(buffer) and buffer[idx] in separators:
+        idx += 1
+
+    return idx
@@ -2,6 +2,7 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 
+from src.const.body_sections import BodySection
 from src.report_manager import Report
 
 
@@ -39,7 +40,9 @@ def load_reports(data_path: str | Path, body_section: str | None = None) -> list
 
     if body_section is not None:
         # print(f"Getting only reports of section {body_section}")
-        df = df[df["file"].str.contains(body_section)]
+        # The body section is resolved once per file, not once per report
+        sections = df["file"].map({x: BodySection.get_section(x) for x in df["file"].unique()})
+        df = df[sections == body_section]
 
     reports = []
     for index, row in df.iterrows():
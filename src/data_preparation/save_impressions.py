@@ -6,6 +6,7 @@ import pandas as pd
 
 from src.const.body_sections import BodySection
 from src.data_preparation.loaders import load_reports_with_impression
+from src.deduplication import DuplicateClusters
 
 from src.report_manager import Report
 
@@ -25,57 +26,53 @@ def create_impression(report: Report) -> list[str | float]:
     return [report.get_impression(), report.orig_acc, report.anon_acc, report.anon_acc_1, report.anon_acc_2]
 
 
-def create_impressions(reports: list[Report], filter_by_modality: list[str] | None = None) -> pd.DataFrame:
+def create_impressions(reports: list[Report], filter_by_modality: list[str] | None = None,
+                       skip_duplicates: bool = False) -> pd.DataFrame:
     """Creates a Dataframe with only the impressions from a list of reports.
 
     Args:
         reports: List of Report objects.
         filter_by_modality: List of modalities to filter the reports. If None, no filtering is done.
+        skip_duplicates: If True, only the first report of each cluster of near-duplicate impressions is kept.
 
     Returns:
         Dataframe of Impressions and their corresponding accession numbers to keep track of them.
 
     """
-    impressions = []
-    for rep in reports:
-        if filter_by_modality is None:
-            impressions.append(create_impression(rep))
-        else:
-            if rep.modality in filter_by_modality:
-                impressions.append(create_impression(rep))
+    if filter_by_modality is not None:
+        reports = [rep for rep in reports if rep.modality in filter_by_modality]
+
+    if skip_duplicates:
+        clusters = DuplicateClusters.from_reports(reports, look_in="impression")
+        print(f"Number of near-duplicate impressions skipped: {clusters.n_duplicates}")
+        reports = [reports[i] for i in clusters.unique_positions]
+
+    impressions = [create_impression(rep) for rep in reports]
 
     return pd.DataFrame(impressions, columns=["impression", "orig_acc", "anon_acc", "anon_acc_1", "anon_acc_2"])
 
 
-def save_impressions(body_section: str, filter_by_modality: list[str] | None = None) -> None:
+def save_impressions(body_section: str, filter_by_modality: list[str] | None = None,
+                     skip_duplicates: bool = False) -> None:
     """Saves the impression sections of the reports in a CSV files.
 
     Args:
         body_section: Body section to save the impressions from.
         filter_by_modality: List of modalities to filter the reports. If None, no filtering is done.
+        skip_duplicates: If True, near-duplicate impressions are saved only once.
 
     """
     reports, _ = load_reports_with_impression("src/data_preparation/data/merged_crosswalks_csv/sdr_crosswalks.csv",
                                               body_section=body_section)
 
-    impressions_df = create_impressions(reports, filter_by_modality)
+    impressions_df = create_impressions(reports, filter_by_modality, skip_duplicates)
 
     # Save to file
     impressions_df.to_csv(f"src/data_preparation/data/impressions/impressions_{body_section.lower()}.csv", index=False)
 
 
 def main():
-    body_sections = [
-        BodySection.BODY,
-        BodySection.CARDIAC,
-        BodySection.CHEST,
-        BodySection.MAMMO,
-        BodySection.MSK,
-        BodySection.NEURO,
-        BodySection.NUCMED,
-        BodySection.PET,
-        BodySection.PEDS,
-    ]
+    body_sections = BodySection.get_sections()
 
     # Filter by modality
     # filter_by_modality = ["mr"]
@@ -0,0 +1,243 @@
+"""This module finds near-duplicate reports (e.g. addenda, repeated reports and cases shared by overlapping rotations)
+with MinHash signatures and locality-sensitive hashing (LSH), and groups them into clusters.
+
+The matchers can then label only one representative of each cluster and copy its prediction to the other members.
+"""
+from __future__ import annotations
+
+import inspect
+import zlib
+from collections.abc import Callable
+from copy import deepcopy
+
+import numpy as np
+
+from src.report_manager import Report
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def get_shingles(text: str, shingle_size: int = 3) -> np.ndarray:
+    """Gets the hashes of the word n-grams (shingles) of a text.
+
+    Args:
+        text: Text to split into shingles.
+        shingle_size: Number of words of each shingle. Texts with fewer words are a single shingle.
+
+    Returns:
+        An array with the distinct 32-bit hashes of the shingles. It is empty if the text is empty.
+
+    """
+    tokens = text.split()
+    if not tokens:
+        return np.array([], dtype=np.uint64)
+
+    shingles = {" ".join(tokens[i:i + shingle_size]) for i in range(max(len(tokens) - shingle_size + 1, 1))}
+
+    # crc32 is used instead of hash() because it is the same in all the processes
+    return np.array([zlib.crc32(x.encode("utf-8")) for x in shingles], dtype=np.uint64)
+
+
+class MinHasher:
+    """Computes MinHash signatures, whose fraction of equal values estimates the Jaccard similarity of two sets.
+
+    Attributes:
+        num_perm: Number of hash functions (i.e. length of the signatures).
+
+    """
+    def __init__(self, num_perm: int = 128, seed: int = 123) -> None:
+        """Initializes a MinHasher object."""
+        self.num_perm = num_perm
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingles: np.ndarray) -> np.ndarray:
+        """Computes the signature of a set of shingles.
+
+        Args:
+            shingles: Hashes of the shingles, as returned by `get_shingles`.
+
+        Returns:
+            An array of shape (num_perm,). Empty sets have the maximum value everywhere.
+
+        """
+        if not len(shingles):
+            return np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+
+        hashes = (np.outer(self._a, shingles) + self._b[:, None]) % _MERSENNE_PRIME & _MAX_HASH
+
+        return hashes.min(axis=1)
+
+
+def get_lsh_params(threshold: float, num_perm: int) -> tuple[int, int]:
+    """Chooses the number of bands and rows per band of the LSH so that pairs with a Jaccard similarity around the
+    threshold have a 50% chance of being candidates.
+
+    Args:
+        threshold: Jaccard similarity threshold.
+        num_perm: Length of the signatures.
+
+    Returns:
+        A tuple with the number of bands and the number of rows per band.
+
+    """
+    options = [(num_perm // r, r) for r in range(1, num_perm + 1) if num_perm % r == 0]
+
+    return min(options, key=lambda x: abs((1 / x[0]) ** (1 / x[1]) - threshold))
+
+
+class DuplicateClusters:
+    """Clusters of near-duplicate reports.
+
+    Attributes:
+        representatives: Position of the representative of the cluster of each report. The representative is the first
+            report of the cluster, so reports without duplicates are their own representative.
+        look_in: Text the clusters were built on. Either "impression", "report" or None if unknown.
+
+    """
+    def __init__(self, representatives: np.ndarray, look_in: str | None = None) -> None:
+        """Initializes a DuplicateClusters object."""
+        self.representatives = representatives
+        self.look_in = look_in
+
+    @classmethod
+    def from_texts(cls, texts: list[str], threshold: float = 0.9, num_perm: int = 128, shingle_size: int = 3,
+                   seed: int = 123) -> DuplicateClusters:
+        """Finds the clusters of near-duplicate texts.
+
+        Two texts are near-duplicates if the Jaccard similarity of their shingles, estimated with their MinHash
+        signatures, is at least the threshold. Only the pairs that share a bucket of the LSH are compared. Empty texts
+        have no shingles to compare, so each of them is its own cluster.
+
+        Args:
+            texts: Texts to cluster.
+            threshold: Jaccard similarity threshold.
+            num_perm: Length of the MinHash signatures.
+            shingle_size: Number of words of each shingle.
+            seed: Seed of the hash functions.
+
+        Returns:
+            The clusters.
+
+        """
+        n = len(texts)
+        if n == 0:
+            return cls(np.array([], dtype=np.int64))
+
+        minhasher = MinHasher(num_perm, seed)
+        shingles = [get_shingles(x, shingle_size) for x in texts]
+        signatures = np.vstack([minhasher.signature(x) for x in shingles])
+        is_empty = np.array([not len(x) for x in shingles])
+
+        n_bands, n_rows = get_lsh_params(threshold, num_perm)
+        parents = np.arange(n)
+        for band in range(n_bands):
+            # Reports with the same values in the rows of the band fall in the same bucket
+            band_signatures = np.ascontiguousarray(signatures[:, band * n_rows:(band + 1) * n_rows])
+            _, first, bucket = np.unique(band_signatures.view(np.dtype((np.void, band_signatures.dtype.itemsize *
+                                                                        n_rows))).ravel(),
+                                         return_index=True, return_inverse=True)
+
+            # Each report is compared to the first report of its bucket
+            candidates = np.flatnonzero((first[bucket] != np.arange(n)) & ~is_empty)
+            for i in candidates:
+                j = first[bucket[i]]
+                if is_empty[j]:
+                    continue
+                if np.mean(signatures[i] == signatures[j]) >= threshold:
+                    _union(parents, i, j)
+
+        return cls(np.array([_find(parents, i) for i in range(n)], dtype=np.int64))
+
+    @classmethod
+    def from_reports(cls, reports: list[Report], look_in: str = "impression", threshold: float = 0.9,
+                     **kwargs) -> DuplicateClusters:
+        """Finds the clusters of near-duplicate reports.
+
+        This is meant to run once, right after the reports are loaded.
+
+        Args:
+            reports: Reports to cluster.
+            look_in: Text to compare. Either "impression" or "report".
+            threshold: Jaccard similarity threshold.
+            **kwargs: Other arguments of `from_texts`.
+
+        Returns:
+            The clusters.
+
+        """
+        clusters = cls.from_texts([x.get_text(look_in) for x in reports], threshold, **kwargs)
+        clusters.look_in = look_in
+
+        return clusters
+
+    def __len__(self) -> int:
+        return len(self.representatives)
+
+    @property
+    def unique_positions(self) -> np.ndarray:
+        """Gets the sorted positions of the representatives of all the clusters."""
+        return np.flatnonzero(self.representatives == np.arange(len(self)))
+
+    @property
+    def n_duplicates(self) -> int:
+        """Gets the number of reports that are not the representative of their cluster."""
+        return len(self) - len(self.unique_positions)
+
+
+def _find(parents: np.ndarray, i: int) -> int:
+    """Finds the root of an element in a union-find forest, compressing the path."""
+    root = i
+    while parents[root] != root:
+        root = parents[root]
+    while parents[i] != root:
+        parents[i], i = root, parents[i]
+
+    return root
+
+
+def _union(parents: np.ndarray, i: int, j: int) -> None:
+    """Joins the sets of two elements in a union-find forest. The smallest position becomes the root."""
+    root_i, root_j = _find(parents, i), _find(parents, j)
+    if root_i != root_j:
+        parents[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def deduplicated_match(match_fn: Callable[..., list[Report]], reports: list[Report], clusters: DuplicateClusters,
+                       *args, **kwargs) -> list[Report]:
+    """Runs a matcher only on the representative of each cluster and copies its prediction to the other members.
+
+    The matcher must look in the same text (look_in) that the clusters were built on.
+
+    Args:
+        match_fn: Matcher, e.g. `exact_match` or `fuzzy_match`.
+        reports: Reports to label.
+        clusters: Clusters of near-duplicates of the reports.
+        *args: Other arguments of the matcher, e.g. the labels.
+        **kwargs: Other keyword arguments of the matcher.
+
+    Returns:
+        A list of Report objects with the predicted pathologies.
+
+    """
+    if clusters.look_in is not None:
+        arguments = inspect.signature(match_fn).bind(reports, *args, **kwargs)
+        arguments.apply_defaults()
+        look_in = arguments.arguments.get("look_in", clusters.look_in)
+        if look_in != clusters.look_in:
+            raise ValueError(f"The clusters were built on look_in={clusters.look_in!r}, but the matcher looks in "
+                             f"{look_in!r}")
+
+    unique_positions = clusters.unique_positions
+    unique_preds = match_fn([reports[i] for i in unique_positions], *args, **kwargs)
+
+    pred_by_representative = dict(zip(unique_positions.tolist(), [x.pred_pathology for x in unique_preds]))
+
+    reports_copy = deepcopy(reports)
+    for report, representative in zip(reports_copy, clusters.representatives.tolist()):
+        report.pred_pathology = pred_by_representative[representative]
+
+    return reports_copy
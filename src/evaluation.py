@@ -0,0 +1,236 @@
+"""This module evaluates the predicted pathologies against the ground truth pathologies assigned by medical experts.
+
+All the metrics are computed with NumPy and pandas over arrays of label indices, so evaluating the whole corpus is
+cheap enough to be done inside a threshold sweep.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from src.const.pathologies import Pathology
+from src.report_manager import Report
+
+
+def get_classes(labels: list[str], extra_values: list[str | None] | None = None) -> list[str]:
+    """Gets the classes used to encode the pathologies.
+
+    The classes are the labels, followed by the unknown pathology and by any other value (e.g. a ground truth
+    pathology that is not in the list of labels).
+
+    Args:
+        labels: Possible pathology labels.
+        extra_values: Values that could not be in the labels.
+
+    Returns:
+        A list of lowercase classes.
+
+    """
+    classes = list(dict.fromkeys([x.lower() for x in labels] + [Pathology.unknown.lower()]))
+    if extra_values is not None:
+        known = set(classes)
+        extra = {x.lower() for x in extra_values if isinstance(x, str)} - known
+        classes.extend(sorted(extra))
+
+    return classes
+
+
+def encode_labels(values: list[str | None], classes: list[str]) -> np.ndarray:
+    """Encodes pathologies as indices of the given classes.
+
+    Args:
+        values: Pathologies to encode. Missing values are allowed.
+        classes: Lowercase classes, as returned by `get_classes`.
+
+    Returns:
+        An array of indices. Missing values and values not in the classes are encoded as -1.
+
+    """
+    values = pd.Series(values, dtype=object).str.lower()
+
+    return pd.Categorical(values, categories=classes).codes.astype(np.int64)
+
+
+def encode_reports(reports: list[Report], labels: list[str]) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """Encodes the ground truth and predicted pathologies of the reports.
+
+    Args:
+        reports: Reports with predicted pathologies.
+        labels: Possible pathology labels.
+
+    Returns:
+        A tuple with the encoded ground truth pathologies, the encoded predicted pathologies and the classes.
+
+    """
+    gt = [x.gt_pathology for x in reports]
+    pred = [x.pred_pathology for x in reports]
+    classes = get_classes(labels, gt + pred)
+
+    return encode_labels(gt, classes), encode_labels(pred, classes), classes
+
+
+def confusion_matrix(gt_idx: np.ndarray, pred_idx: np.ndarray, n_classes: int) -> np.ndarray:
+    """Computes the confusion matrix.
+
+    Only the pairs where both the ground truth and the prediction are known (i.e. not -1) are counted.
+
+    Args:
+        gt_idx: Encoded ground truth pathologies.
+        pred_idx: Encoded predicted pathologies.
+        n_classes: Number of classes.
+
+    Returns:
+        A matrix of shape (n_classes, n_classes) where rows are ground truths and columns are predictions.
+
+    """
+    valid = (gt_idx >= 0) & (pred_idx >= 0)
+    flat = gt_idx[valid] * n_classes + pred_idx[valid]
+
+    return np.bincount(flat, minlength=n_classes * n_classes).reshape(n_classes, n_classes)
+
+
+def evaluate_arrays(gt_idx: np.ndarray, pred_idx: np.ndarray, unknown_idx: int) -> dict:
+    """Computes the summary metrics from encoded pathologies.
+
+    Args:
+        gt_idx: Encoded ground truth pathologies.
+        pred_idx: Encoded predicted pathologies.
+        unknown_idx: Index of the unknown pathology.
+
+    Returns:
+        A dictionary with the number of reports, the number of reports with ground truth, the number of unknown
+        predictions, the unknown rate and the accuracy (NaN if no report has ground truth).
+
+    """
+    n_reports = len(pred_idx)
+    evaluated = (gt_idx >= 0) & (pred_idx >= 0)
+    n_evaluated = int(evaluated.sum())
+    n_unknown = int((pred_idx == unknown_idx).sum())
+
+    return {
+        "n_reports": n_reports,
+        "n_evaluated": n_evaluated,
+        "n_unknown": n_unknown,
+        "unknown_rate": n_unknown / n_reports if n_reports else np.nan,
+        "accuracy": float((gt_idx[evaluated] == pred_idx[evaluated]).mean()) if n_evaluated else np.nan,
+    }
+
+
+def evaluate(reports: list[Report], labels: list[str]) -> dict:
+    """Evaluates the predicted pathologies of the reports.
+
+    Args:
+        reports: Reports with predicted pathologies.
+        labels: Possible pathology labels.
+
+    Returns:
+        A dictionary with the summary metrics. See `evaluate_arrays`.
+
+    """
+    gt_idx, pred_idx, classes = encode_reports(reports, labels)
+
+    return evaluate_arrays(gt_idx, pred_idx, classes.index(Pathology.unknown.lower()))
+
+
+def per_label_metrics(reports: list[Report], labels: list[str]) -> pd.DataFrame:
+    """Computes the precision, recall and F1 score of each pathology.
+
+    Args:
+        reports: Reports with predicted pathologies.
+        labels: Possible pathology labels.
+
+    Returns:
+        A Dataframe indexed by pathology with the precision, recall, F1 score and support (number of ground truths).
+
+    """
+    gt_idx, pred_idx, classes = encode_reports(reports, labels)
+    cm = confusion_matrix(gt_idx, pred_idx, len(classes))
+
+    tp = np.diag(cm).astype(float)
+    n_pred = cm.sum(axis=0)
+    support = cm.sum(axis=1)
+    precision = np.divide(tp, n_pred, out=np.zeros_like(tp), where=n_pred > 0)
+    recall = np.divide(tp, support, out=np.zeros_like(tp), where=support > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros_like(tp), where=(precision + recall) > 0)
+
+    return pd.DataFrame({"precision": precision, "recall": recall, "f1": f1, "support": support},
+                        index=pd.Index(classes, name="pathology"))
+
+
+def get_confusion_matrix(reports: list[Report], labels: list[str]) -> pd.DataFrame:
+    """Computes the confusion matrix of the reports.
+
+    Args:
+        reports: Reports with predicted pathologies.
+        labels: Possible pathology labels.
+
+    Returns:
+        A Dataframe where the index holds the ground truth pathologies and the columns the predicted ones.
+
+    """
+    gt_idx, pred_idx, classes = encode_reports(reports, labels)
+
+    return pd.DataFrame(confusion_matrix(gt_idx, pred_idx, len(classes)),
+                        index=pd.Index(classes, name="ground truth"), columns=pd.Index(classes, name="predicted"))
+
+
+def evaluate_by(reports: list[Report], labels: list[str], by: str = "body_section") -> pd.DataFrame:
+    """Evaluates the predicted pathologies of the reports grouped by a report attribute.
+
+    Args:
+        reports: Reports with predicted pathologies.
+        labels: Possible pathology labels.
+        by: Attribute of the reports to group by, e.g. "body_section" or "modality".
+
+    Returns:
+        A Dataframe indexed by group with the summary metrics. See `evaluate_arrays`.
+
+    """
+    gt_idx, pred_idx, classes = encode_reports(reports, labels)
+    evaluated = (gt_idx >= 0) & (pred_idx >= 0)
+
+    df = pd.DataFrame({
+        by: [getattr(x, by) for x in reports],
+        "n_evaluated": evaluated,
+        "n_unknown": pred_idx == classes.index(Pathology.unknown.lower()),
+        "n_correct": evaluated & (gt_idx == pred_idx),
+    })
+    grouped = df.groupby(by, dropna=False)
+    result = grouped[["n_evaluated", "n_unknown", "n_correct"]].sum()
+    result.insert(0, "n_reports", grouped.size())
+    result["unknown_rate"] = result["n_unknown"] / result["n_reports"]
+    result["accuracy"] = result["n_correct"] / result["n_evaluated"].where(result["n_evaluated"] > 0)
+
+    return result.drop(columns="n_correct")
+
+
+def compare_runs(runs: dict[str, list[Report]], labels: list[str]) -> pd.DataFrame:
+    """Compares the summary metrics of several runs of matchers side by side.
+
+    Args:
+        runs: Dictionary from the name of the run to the reports it labeled.
+        labels: Possible pathology labels.
+
+    Returns:
+        A Dataframe indexed by run name with the summary metrics. See `evaluate_arrays`.
+
+    """
+    return pd.DataFrame.from_dict({name: evaluate(reports, labels) for name, reports in runs.items()},
+                                  orient="index").rename_axis("run")
+
+
+def count_predictions(reports: list[Report], labels: list[str]) -> pd.Series:
+    """Counts the number of reports predicted for each pathology.
+
+    Args:
+        reports: Reports with predicted pathologies.
+        labels: Possible pathology labels.
+
+    Returns:
+        A Series indexed by the labels and the unknown pathology with the number of predictions.
+
+    """
+    index = list(dict.fromkeys(labels + [Pathology.unknown]))
+    codes = pd.Categorical([x.pred_pathology for x in reports], categories=index).codes
+
+    return pd.Series(np.bincount(codes[codes >= 0], minlength=len(index)), index=index)
@@ -0,0 +1,185 @@
+"""This module compiles the pathology labels (and their synonyms) into a lookup table of normalized lemmas, so that
+inflected forms such as "fractures" or "effusions" are matched at almost the cost of an exact match.
+
+The texts of the reports are normalized with the same steps. Lemmatizing is the expensive step, so each distinct token
+is lemmatized only once and kept in a cache shared by the labels and all the reports.
+"""
+from __future__ import annotations
+
+import re
+from collections.abc import Callable
+
+from src.const.pipelines import PipelineProfile
+
+# Hyphens and slashes separate words (e.g. "non-displaced" and "non displaced" are the same) and any other punctuation
+# is dropped
+_WORD_SEPARATORS = re.compile(r"[\-\u2010-\u2015/]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def normalize_text(text: str) -> list[str]:
+    """Lowercases a text, folds its hyphens and punctuation and splits it into tokens.
+
+    Args:
+        text: Text to normalize.
+
+    Returns:
+        A list of tokens.
+
+    """
+    text = _WORD_SEPARATORS.sub(" ", text.lower())
+
+    return _PUNCTUATION.sub("", text).split()
+
+
+def load_lemmatizer(batch_size: int = 1000) -> Callable[[list[str]], list[str]]:
+    """Returns a function that lemmatizes tokens with spacy.
+
+    Only the components needed to lemmatize are loaded (see PipelineProfile.LEMMA).
+
+    Args:
+        batch_size: Number of tokens processed at the same time by spacy.
+
+    Returns:
+        A function that takes a list of tokens and returns the list of their lemmas.
+
+    """
+    from src.nlp_models import get_nlp_model
+
+    nlp = get_nlp_model(PipelineProfile.LEMMA)
+
+    def lemmatize(tokens: list[str]) -> list[str]:
+        return ["".join(x.lemma_ for x in doc) or token for doc, token in zip(nlp.pipe(tokens, batch_size=batch_size),
+                                                                               tokens)]
+
+    return lemmatize
+
+
+class LemmaCache:
+    """Memoized mapping from tokens to lemmas.
+
+    The lemmatizer is only called with the tokens that have never been seen before, in a single batch per call.
+
+    Attributes:
+        lemmatize_fn: Function that takes a list of tokens and returns the list of their lemmas.
+
+    """
+    def __init__(self, lemmatize_fn: Callable[[list[str]], list[str]] | None = None) -> None:
+        """Initializes a LemmaCache object.
+
+        Args:
+            lemmatize_fn: Function that lemmatizes a list of tokens. If None, the spacy lemmatizer is loaded the first
+                time it is needed.
+
+        """
+        self.lemmatize_fn = lemmatize_fn
+        self._lemmas = {}
+
+    def __len__(self) -> int:
+        return len(self._lemmas)
+
+    def lemmatize(self, tokens: list[str]) -> list[str]:
+        """Lemmatizes a list of tokens.
+
+        Args:
+            tokens: Tokens to lemmatize.
+
+        Returns:
+            A list with the lemma of each token.
+
+        """
+        return self.lemmatize_many([tokens])[0]
+
+    def lemmatize_many(self, docs: list[list[str]]) -> list[list[str]]:
+        """Lemmatizes many lists of tokens, calling the lemmatizer once with all the new distinct tokens.
+
+        Args:
+            docs: Lists of tokens to lemmatize.
+
+        Returns:
+            A list with the lemmas of each list of tokens.
+
+        """
+        new_tokens = list(dict.fromkeys(x for doc in docs for x in doc if x not in self._lemmas))
+        if new_tokens:
+            if self.lemmatize_fn is None:
+                self.lemmatize_fn = load_lemmatizer()
+            self._lemmas.update(zip(new_tokens, self.lemmatize_fn(new_tokens)))
+
+        return [[self._lemmas[x] for x in doc] for doc in docs]
+
+
+class CompiledLabels:
+    """Lookup table from the normalized lemmas of the labels and their synonyms to the labels.
+
+    Attributes:
+        labels: Pathology labels, in order of priority.
+        lemma_cache: Cache of lemmas shared by the labels and the texts.
+
+    """
+    def __init__(self, labels: list[str], synonyms_dict: dict[str, list[str]] | None = None,
+                 lemma_cache: LemmaCache | None = None) -> None:
+        """Compiles the labels.
+
+        Args:
+            labels: Pathology labels. If a text contains more than one, the first one in this list is chosen.
+            synonyms_dict: Dictionary from a label to its synonyms. Synonyms are mapped to their label.
+            lemma_cache: Cache of lemmas. If None, a new one is created.
+
+        """
+        self.labels = labels
+        self.lemma_cache = lemma_cache if lemma_cache is not None else LemmaCache()
+
+        forms = []
+        for i, label in enumerate(labels):
+            forms.append((i, label))
+            if synonyms_dict is not None:
+                forms.extend((i, x) for x in synonyms_dict.get(label, []))
+
+        lemmas = self.lemma_cache.lemmatize_many([normalize_text(x) for _, x in forms])
+
+        # When two labels have the same normalized form, the first one wins
+        self._lookup = {}
+        for (i, _), form_lemmas in zip(forms, lemmas):
+            if form_lemmas:
+                self._lookup.setdefault(tuple(form_lemmas), i)
+        self._lengths = sorted({len(x) for x in self._lookup})
+
+    def __len__(self) -> int:
+        return len(self._lookup)
+
+    def find_label_index(self, lemmas: list[str]) -> int | None:
+        """Finds the label with the highest priority in a normalized text.
+
+        Args:
+            lemmas: Lemmas of the tokens of the text.
+
+        Returns:
+            The position of the label in the labels, or None if no label is found.
+
+        """
+        best = None
+        for n in self._lengths:
+            for start in range(len(lemmas) - n + 1):
+                i = self._lookup.get(tuple(lemmas[start:start + n]))
+                if i is not None and (best is None or i < best):
+                    best = i
+
+        return best
+
+    def find_labels(self, texts: list[str]) -> list[str | None]:
+        """Finds the label with the highest priority in each text.
+
+        All the texts are lemmatized in a single batch.
+
+        Args:
+            texts: Texts to look in.
+
+        Returns:
+            A list with the label found in each text, or None if no label is found.
+
+        """
+        docs = self.lemma_cache.lemmatize_many([normalize_text(x) for x in texts])
+        indices = [self.find_label_index(x) for x in docs]
+
+        return [self.labels[i] if i is not None else None for i in indices]
@@ -1,23 +1,28 @@
-from tqdm import tqdm
+from __future__ import annotations
+
 from copy import deepcopy
-from rapidfuzz import fuzz
-import numpy as np
-import spacy
-from negspacy.negation import Negex
-from negspacy.termsets import termset
+from typing import TYPE_CHECKING
 
 from src.report_manager import Report
 from src.const.body_sections import BodySection
 from src.const.pathologies import Pathology
-from src.data_preparation.loaders import load_pathology_labels, load_reports, load_radlex_synonyms
-
+from src.data_preparation.loaders import (load_pathology_labels, load_reports, load_reports_with_impression,
+                                         load_radlex_synonyms)
+from src.memoization import PredictionCache, get_model_key, make_key
+from src.nlp_models import get_negation_patterns, get_nlp_model
 
-spacy.prefer_gpu()
+# Heavy dependencies are imported inside the functions that need them, so that importing this module is fast
+if TYPE_CHECKING:
+    import spacy
+    from src.label_compiler import CompiledLabels, LemmaCache
+    from src.prefilter import NgramLabelIndex
 
 
 # Exact match
 def exact_match(reports: list[Report], labels: list[str], look_in: str = "impression",
-                check_synonyms: bool = False) -> list[Report]:
+                check_synonyms: bool = False, nlp: spacy.language.Language | None = None,
+                synonyms_dict: dict[str, list[str]] | None = None,
+                cache: PredictionCache | None = None) -> list[Report]:
     """Finds the pathology of each report using exact match.
 
     Args:
@@ -25,58 +30,91 @@ def exact_match(reports: list[Report], labels: list[str], look_in: str = "impres
         look_in: Text to look in. Either "impression" to look only in the impression section or "report" to look in
             the whole report.
         check_synonyms: If True, the synonyms of the pathology will be checked as well.
+        nlp: Spacy model used to detect negations. If None, the model is loaded.
+        synonyms_dict: Dictionary from a label to its synonyms (see `load_radlex_synonyms`). Required if check_synonyms
+            is True.
+        cache: If given, the prediction of each text is memoized in this cache.
 
     Returns:
         A list of Report objects with the predicted pathologies.
 
     """
+    from tqdm import tqdm
+
+    if check_synonyms and synonyms_dict is None:
+        raise ValueError("synonyms_dict must be given to check synonyms")
+
     # Load Spacy model
-    nlp = get_nlp_model()
+    if nlp is None:
+        nlp = get_nlp_model()
+
+    if not check_synonyms:
+        synonyms_dict = None
 
     reports_copy = deepcopy(reports)
 
+    if cache is not None:
+        config_key = make_key("exact_match", labels, synonyms_dict, get_model_key(nlp))
+
     for report in tqdm(reports_copy):
-        if look_in == "impression":
-            text = report.get_impression()
-        elif look_in == "report":
-            text = report.text
+        text = report.get_text(look_in)
+
+        if cache is not None:
+            report.pred_pathology = cache.get_or_compute(make_key(config_key, text), _predict_exact, text, labels,
+                                                         synonyms_dict, nlp, cache)
         else:
-            raise ValueError(f"look_in must be 'impression' or 'report'")
+            report.pred_pathology = _predict_exact(text, labels, synonyms_dict, nlp)
 
-        # This variable is needed to check that no pathology was assigned
-        found_path = False
-        for label in labels:
-            # We only accept a match if the whole n-gram of the label is in the impression
-            if label in text:
-                # Check if the label is being negated
-                if is_pathology_negated(label, text, nlp):
-                    break
-                else:
-                    report.pred_pathology = label
-                    found_path = True
-                    break
-
-            # TODO: break into different function and have more advance matching
-            # Check for synonyms of pathologies
-            # WARNING: no synonyms help
-            if check_synonyms:
-                if label in synonyms_dict:
-                    for synonym in synonyms_dict[label]:
-                        if synonym in text:
-                            report.pred_pathology = label
-                            found_path = True
-                            break
-
-        # No pathology was found
-        if not found_path:
-            report.pred_pathology = Pathology.unknown
+    if cache is not None:
+        cache.flush()
 
     return reports_copy
 
 
+def _predict_exact(text: str, labels: list[str], synonyms_dict: dict[str, list[str]] | None,
+                   nlp: spacy.language.Language, cache: PredictionCache | None = None) -> str:
+    """Finds the pathology of a text using exact match."""
+    label_idx, is_synonym = find_exact_label(text, labels, synonyms_dict)
+
+    # No pathology was found or it is being negated
+    if label_idx is None or (not is_synonym and is_pathology_negated(labels[label_idx], text, nlp, cache)):
+        return Pathology.unknown
+
+    return labels[label_idx]
+
+
+def find_exact_label(text: str, labels: list[str],
+                     synonyms_dict: dict[str, list[str]] | None = None) -> tuple[int | None, bool]:
+    """Finds the first label that appears in a text.
+
+    Args:
+        text: Text to look in.
+        labels: Possible pathology labels, in order of priority.
+        synonyms_dict: If given, a label is also found when one of its synonyms appears in the text.
+
+    Returns:
+        A tuple with the position of the label found (None if no label is found) and whether it was found through a
+        synonym.
+
+    """
+    for i, label in enumerate(labels):
+        # We only accept a match if the whole n-gram of the label is in the impression
+        if label in text:
+            return i, False
+
+        # TODO: have more advance matching
+        # Check for synonyms of pathologies
+        # WARNING: no synonyms help
+        if synonyms_dict is not None and any(synonym in text for synonym in synonyms_dict.get(label, [])):
+            return i, True
+
+    return None, False
+
+
 # Fuzzy match
 def fuzzy_match(reports: list[Report], labels: list[str],  look_in: str = "impression",
-                threshold: float = 80.0) -> list[Report]:
+                threshold: float = 80.0, nlp: spacy.language.Language | None = None, prefilter: bool = False,
+                min_overlap_ratio: float | None = None, cache: PredictionCache | None = None) -> list[Report]:
     """Finds the pathology of each report using fuzzy match.
 
     This function changes the report object in-place by adding the predicted pathology to the 'pred_pathology' field.
@@ -86,26 +124,67 @@ def fuzzy_match(reports: list[Report], labels: list[str],  look_in: str = "impre
         look_in: Text to look in. Either "impression" to look only in the impression section or "report" to look in
             the whole report.
         threshold: Threshold for the fuzzy match.
+        nlp: Spacy model used to detect negations. If None, the model is loaded.
+        prefilter: If True, only the labels that have enough character bigrams in place in the text to reach the
+            threshold are scored (see `src.prefilter`). The predictions are the same unless min_overlap_ratio is given.
+            The prefilter prunes more the higher the threshold (most of the labels at 90, about half at 80).
+        min_overlap_ratio: Fraction of the bigrams of a label that must be in place in the text for it to be scored,
+            instead of the lossless bound of the prefilter. Only used if prefilter is True.
+        cache: If given, the prediction of each text is memoized in this cache.
 
     Returns:
         A list with the predicted pathologies.
 
     """
+    from tqdm import tqdm
+
+    from src.prefilter import NgramLabelIndex
+
+    label_index = NgramLabelIndex(labels) if prefilter else None
+
     # Load Spacy model
-    nlp = get_nlp_model()
+    if nlp is None:
+        nlp = get_nlp_model()
 
     reports_copy = deepcopy(reports)
 
+    if cache is not None:
+        # Only the heuristic overlap of the prefilter can change the predictions
+        config_key = make_key("fuzzy_match", labels, threshold, min_overlap_ratio if prefilter else None,
+                              get_model_key(nlp))
+
     for report in tqdm(reports_copy):
-        if look_in == "impression":
-            text = report.get_impression()
-        elif look_in == "report":
-            text = report.text
+        text = report.get_text(look_in)
+
+        if cache is not None:
+            report.pred_pathology = cache.get_or_compute(make_key(config_key, text), _predict_fuzzy, text, labels,
+                                                         threshold, nlp, label_index, min_overlap_ratio, cache)
         else:
-            raise ValueError(f"look_in must be 'impression' or 'report'")
+            report.pred_pathology = _predict_fuzzy(text, labels, threshold, nlp, label_index, min_overlap_ratio)
+
+    if cache is not None:
+        cache.flush()
+
+    # With a cache, only the texts that were not cached are prefiltered
+    if label_index is not None and label_index.n_checked:
+        print(f"Prefilter pruning ratio: {label_index.pruning_ratio:.2%}")
+
+    return reports_copy
+
 
-        # This variable is needed to check that no pathology was assigned
-        found_path = False
+def _predict_fuzzy(text: str, labels: list[str], threshold: float, nlp: spacy.language.Language,
+                   label_index: NgramLabelIndex | None = None, min_overlap_ratio: float | None = None,
+                   cache: PredictionCache | None = None) -> str:
+    """Finds the pathology of a text using fuzzy match."""
+    import numpy as np
+    from rapidfuzz import fuzz
+
+    if label_index is not None:
+        # Only the candidate labels are scored, and scores below the threshold are left as 0
+        fuzzy_scores = np.zeros(len(labels))
+        for i in label_index.get_candidates(text, threshold, min_overlap_ratio):
+            fuzzy_scores[i] = fuzz.partial_ratio(labels[i], text, score_cutoff=threshold)
+    else:
         fuzzy_scores = []
         for label in labels:
             # We calculate the fuzzy score for all pathologies and get the highest one that is above the threshold
@@ -113,69 +192,135 @@ def fuzzy_match(reports: list[Report], labels: list[str],  look_in: str = "impre
             score = fuzz.partial_ratio(label, text)
             fuzzy_scores.append(score)
 
-        # Only get the highest score that is above the threshold
-        max_idx = np.argmax(fuzzy_scores)
-        max_score = fuzzy_scores[max_idx]
-        if max_score > threshold:
-            # Check if the label is being negated
-            if not is_pathology_negated(labels[max_idx], text, nlp):
-                report.pred_pathology = labels[max_idx]
-                found_path = True
-
-        # No pathology was found
-        if not found_path:
+    # Only get the highest score that is above the threshold
+    max_idx = np.argmax(fuzzy_scores)
+    max_score = fuzzy_scores[max_idx]
+    # Check if the label is being negated
+    if max_score > threshold and not is_pathology_negated(labels[max_idx], text, nlp, cache):
+        return labels[max_idx]
+
+    # No pathology was found
+    return Pathology.unknown
+
+
+# Token fuzzy match
+def token_fuzzy_match(reports: list[Report], labels: list[str], look_in: str = "impression",
+                      threshold: float = 80.0, lemma_cache: LemmaCache | None = None,
+                      nlp: spacy.language.Language | None = None) -> list[Report]:
+    """Finds the pathology of each report using fuzzy match between the labels and the tokens of the report.
+
+    Args:
+        reports: Reports to label.
+        labels: Possible pathology labels.
+        look_in: Text to look in. Either "impression" to look only in the impression section or "report" to look in
+            the whole report.
+        threshold: Threshold for the fuzzy match.
+        lemma_cache: If given, the tokens of the labels and the reports are lemmatized with this cache.
+        nlp: Spacy model used to detect negations. If None, the model is loaded.
+
+    Returns:
+        A list of Report objects with the predicted pathologies.
+
+    """
+    import numpy as np
+    from tqdm import tqdm
+
+    from src.token_fuzzy import TokenFuzzyScorer
+
+    # Load Spacy model
+    if nlp is None:
+        nlp = get_nlp_model()
+
+    reports_copy = deepcopy(reports)
+
+    texts = [report.get_text(look_in) for report in reports_copy]
+    fuzzy_scores = TokenFuzzyScorer(labels, lemma_cache).score(texts)
+
+    # Only get the highest score that is above the threshold. In case of draw, we arbitrarily take the first one
+    max_idx = np.argmax(fuzzy_scores, axis=1) if labels else np.zeros(len(texts), dtype=int)
+    max_scores = fuzzy_scores[np.arange(len(texts)), max_idx] if labels else np.zeros(len(texts))
+
+    for report, text, idx, score in zip(tqdm(reports_copy), texts, max_idx, max_scores):
+        # Check if the label is being negated
+        if score > threshold and not is_pathology_negated(labels[idx], text, nlp):
+            report.pred_pathology = labels[idx]
+        else:
             report.pred_pathology = Pathology.unknown
 
     return reports_copy
 
 
-def get_negation_patterns():
-    """Returns the negation patterns."""
-    ts = termset("en_clinical")
-    ts.add_patterns({
-        "preceding_negations": ["no obvious", "normal appearance of the"],
-        "following_negations": ["normal"]
-    })
+# Compiled match
+def compiled_match(reports: list[Report], compiled_labels: CompiledLabels, look_in: str = "impression",
+                   nlp: spacy.language.Language | None = None) -> list[Report]:
+    """Finds the pathology of each report matching the normalized lemmas of the compiled labels.
+
+    Unlike the exact match, inflected forms of the labels (e.g. plurals) are matched too.
+
+    Args:
+        reports: Reports to label.
+        compiled_labels: Labels compiled with their synonyms.
+        look_in: Text to look in. Either "impression" to look only in the impression section or "report" to look in
+            the whole report.
+        nlp: Spacy model used to detect negations. If None, the model is loaded.
+
+    Returns:
+        A list of Report objects with the predicted pathologies.
+
+    """
+    from tqdm import tqdm
 
-    return ts
+    # Load Spacy model
+    if nlp is None:
+        nlp = get_nlp_model()
 
+    reports_copy = deepcopy(reports)
 
-def get_nlp_model() -> spacy.language.Language:
-    """Returns the spacy model."""
-    try:
-        nlp = spacy.load("en_core_sci_lg")
-    except:
-        # This is only for streamlit
-        import subprocess
-        url = "https://s3-us-west-2.amazonaws.com/ai2-s2-scispacy/releases/v0.5.0/en_core_sci_lg-0.5.0.tar.gz"
-        subprocess.run(["pip", "install", url])
-        nlp = spacy.load("en_core_sci_lg")
+    texts = [report.get_text(look_in) for report in reports_copy]
+    found_labels = compiled_labels.find_labels(texts)
 
-    ts = get_negation_patterns()
-    nlp.add_pipe(
-        "negex",
-        config={
-            "neg_termset": ts.get_patterns()
-        }
-    )
+    for report, text, label in zip(tqdm(reports_copy), texts, found_labels):
+        # Check if the label is being negated
+        if label is not None and not is_pathology_negated(label, text, nlp):
+            report.pred_pathology = label
+        else:
+            report.pred_pathology = Pathology.unknown
 
-    return nlp
+    return reports_copy
 
 
-def is_pathology_negated(pathology: str, text: str, nlp: spacy.language.Language) -> bool:
+def is_pathology_negated(pathology: str, text: str, nlp: spacy.language.Language,
+                         cache: PredictionCache | None = None) -> bool:
     """Checks if a pathology is negated in a text corresponding to a report or part of a report.
 
     Args:
         pathology: Pathology to check.
         text: Text to check in.
+        nlp: Spacy model used to detect negations.
+        cache: If given, the result is memoized in this cache.
+
+    Returns:
+        True if the label is negated in the text, False otherwise.
+
+    """
+    if cache is not None:
+        return cache.get_or_compute(make_key("is_pathology_negated", pathology, get_model_key(nlp), text),
+                                    is_pathology_negated, pathology, text, nlp)
+
+    return is_pathology_negated_in_doc(pathology, nlp(text))
+
+
+def is_pathology_negated_in_doc(pathology: str, doc: spacy.tokens.Doc) -> bool:
+    """Checks if a pathology is negated in a text that has already been processed by the spacy model.
+
+    Args:
+        pathology: Pathology to check.
+        doc: Spacy document of the text.
 
     Returns:
         True if the label is negated in the text, False otherwise.
 
     """
-    # TODO: Save these models once so that they aren't recalculated every time we change the threshold or we call the
-    #  function again
-    doc = nlp(text)
     for e in doc.ents:
         if pathology in e.text or e.text in pathology:
             if e._.negex:
@@ -195,47 +340,28 @@ def count_pred_path(reports: list[Report], possible_labels: list[str]) -> dict:
         A dictionary with the number of predicted pathologies for each pathology.
 
     """
-    possible_labels_copy = possible_labels.copy()
-    possible_labels_copy.append(Pathology.unknown)
-    
-    # Initialize counter
-    counter = {x:0 for x in possible_labels_copy}
-    for report in reports:
-        counter[report.pred_pathology] += 1
+    from src.evaluation import count_predictions
 
-    return counter
+    return count_predictions(reports, possible_labels).to_dict()
 
 
 if __name__ == '__main__':
+    from src.comparison import MatcherConfig, compare_configs
+
     labels = load_pathology_labels("src/data_preparation/data/pathology_labels/pathology_labels.csv")
-    reports, non_impression_reports = load_reports("src/data_preparation/data/merged_crosswalks_csv/sdr_crosswalks.csv",
-                                                   body_section=BodySection.MSK)
+    reports, non_impression_reports = load_reports_with_impression(
+        "src/data_preparation/data/merged_crosswalks_csv/sdr_crosswalks.csv", body_section=BodySection.MSK)
     synonyms_dict = load_radlex_synonyms("src/data_preparation/data/radlex/radlex.xls")
 
-    # Exact match
-    preds_exact_impression = exact_match(reports, labels, "impression")
-    c_exact_impression = count_pred_path(preds_exact_impression, labels)
-    print(f"Number of unlabeled reports with exact matching in the impression: {c_exact_impression[Pathology.unknown]}")
-
-    preds_exact_whole_report = exact_match(reports, labels, "report")
-    c_exact_whole_report = count_pred_path(preds_exact_whole_report, labels)
-    print(f"Number of unlabeled reports with exact matching in the whole report: {c_exact_whole_report[Pathology.unknown]}")
-
-    # Fuzzy match
-    preds_fuzzy_impression = fuzzy_match(reports, labels, "impression", threshold=70)
-    c_fuzzy_impression = count_pred_path(preds_fuzzy_impression, labels)
-    print(f"Number of unlabeled reports with fuzzy matching in the impression: {c_fuzzy_impression[Pathology.unknown]}")
-
-    preds_fuzzy_whole_report = fuzzy_match(reports, labels, "report", threshold=70)
-    c_fuzzy_whole_report = count_pred_path(preds_fuzzy_whole_report, labels)
-    print(f"Number of unlabeled reports with fuzzy matching in the whole report: {c_fuzzy_whole_report[Pathology.unknown]}")
-
-
-    ## Check with synonyms
-    # preds_exact_impression_synonyms = exact_match(reports, labels, "impression", check_synonyms=True)
-    # c_exat_impression_synonyms = count_pred_path(preds_exact_impression_synonyms, labels)
-    # print(f"Number of unlabeled reports with exact matching in the impression with synonyms: {c_exat_impression_synonyms[Pathology.unknown]}")
-    #
-    # preds_exact_whole_report_synonyms = exact_match(reports, labels, "report", check_synonyms=True)
-    # c_exact_whole_report_synonyms = count_pred_path(preds_exact_whole_report_synonyms, labels)
-    # print(f"Number of unlabeled reports with exact matching in the whole report with synonyms: {c_exact_whole_report_synonyms[Pathology.unknown]}")
+    # All the configurations share the section extraction, the fuzzy scores and the negation checks
+    configs = [
+        MatcherConfig("exact", "impression"),
+        MatcherConfig("exact", "report"),
+        MatcherConfig("fuzzy", "impression", threshold=70),
+        MatcherConfig("fuzzy", "report", threshold=70),
+        ## Check with synonyms
+        # MatcherConfig("exact", "impression", check_synonyms=True),
+        # MatcherConfig("exact", "report", check_synonyms=True),
+    ]
+    comparison = compare_configs(reports, labels, configs, synonyms_dict)
+    print(comparison[["n_unknown", "unknown_rate", "accuracy"]].to_string())
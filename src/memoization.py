@@ -0,0 +1,226 @@
+"""This module memoizes the decisions of the matchers, so that the same text is never labeled twice with the same
+configuration, across runs, body sections and duplicate reports.
+
+The decisions are stored under a hash of the text, the labels, the parameters of the matcher, the spacy model and
+CACHE_VERSION in an in-memory LRU cache with a size bound and, optionally, in a SQLite database on disk that persists
+between runs.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    import spacy
+
+# Version of the decisions stored in the cache. It must be increased whenever the matching logic changes (e.g.
+# find_exact_label or the negation check), so that the decisions stored on disk by previous versions are not reused
+CACHE_VERSION = 1
+
+_MISSING = object()
+
+
+def make_key(*parts: Any) -> str:
+    """Hashes the parts of a cache key.
+
+    Args:
+        *parts: JSON-serializable parts, e.g. the name of the matcher, the labels, the parameters and the text.
+            Dictionaries are hashed regardless of the order of their keys, but the order of lists matters.
+
+    Returns:
+        The SHA-256 hex digest of the parts and the cache version.
+
+    """
+    data = json.dumps((CACHE_VERSION, parts), sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def get_model_key(nlp: spacy.language.Language) -> str:
+    """Gets a key of a spacy model, so that decisions made with another model are not reused.
+
+    The key includes the name and version of the model, its components (i.e. its pipeline profile) and the
+    configuration of the negex component (i.e. the negation patterns).
+
+    Args:
+        nlp: Spacy model.
+
+    Returns:
+        The key of the model.
+
+    """
+    return _get_model_key(nlp, tuple(nlp.pipe_names))
+
+
+@lru_cache(maxsize=16)
+def _get_model_key(nlp: spacy.language.Language, pipe_names: tuple[str, ...]) -> str:
+    """Computes the key of a spacy model once per model and set of components."""
+    negex_config = nlp.get_pipe_config("negex") if "negex" in pipe_names else None
+
+    return make_key(nlp.meta.get("lang"), nlp.meta.get("name"), nlp.meta.get("version"), pipe_names,
+                    json.loads(json.dumps(negex_config, sort_keys=True, default=str)))
+
+
+class PredictionCache:
+    """Two-tier cache of the decisions of the matchers.
+
+    The values must be JSON-serializable. The cache can be shared by several threads (e.g. the sessions of the
+    Streamlit app).
+
+    Attributes:
+        maxsize: Maximum number of entries of the in-memory tier.
+        db_path: Path of the SQLite database of the on-disk tier. None if there is no on-disk tier.
+        hits: Number of lookups found in memory.
+        disk_hits: Number of lookups found on disk.
+        misses: Number of lookups not found.
+
+    """
+    def __init__(self, maxsize: int = 100000, db_path: str | Path | None = None, commit_every: int = 1000) -> None:
+        """Initializes a PredictionCache object."""
+        if maxsize < 0:
+            raise ValueError(f"maxsize must be non-negative, not {maxsize}")
+
+        self.maxsize = maxsize
+        self.db_path = Path(db_path).resolve() if db_path is not None else None
+        self.hits = self.disk_hits = self.misses = 0
+
+        self._commit_every = commit_every
+        self._n_pending = 0
+        self._memory = OrderedDict()
+        self._lock = threading.RLock()
+
+        self._db = None
+        if self.db_path is not None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._db.commit()
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def __enter__(self) -> PredictionCache:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def stats(self) -> dict[str, float]:
+        """Gets the hit and miss statistics of the cache."""
+        n_lookups = self.hits + self.disk_hits + self.misses
+
+        return {"hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / n_lookups if n_lookups else 0.0,
+                "size": len(self)}
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Looks up a value, first in memory and then on disk.
+
+        Args:
+            key: Key of the value (see `make_key`).
+            default: Value returned if the key is not found.
+
+        Returns:
+            The cached value, or the default if the key is not found.
+
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM predictions WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._set_memory(key, value)
+                    self.disk_hits += 1
+                    return value
+
+            self.misses += 1
+            return default
+
+    def set(self, key: str, value: Any) -> None:
+        """Stores a value in memory and on disk.
+
+        Args:
+            key: Key of the value (see `make_key`).
+            value: JSON-serializable value.
+
+        """
+        with self._lock:
+            self._set_memory(key, value)
+
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO predictions (key, value) VALUES (?, ?)",
+                                 (key, json.dumps(value)))
+                # Committing every write would be slow, so the writes are committed in batches
+                self._n_pending += 1
+                if self._n_pending >= self._commit_every:
+                    self.flush()
+
+    def get_or_compute(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Looks up a value and, if it is not found, computes it and stores it.
+
+        Args:
+            key: Key of the value (see `make_key`).
+            fn: Function that computes the value.
+            *args: Arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            The cached or computed value.
+
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = fn(*args, **kwargs)
+            self.set(key, value)
+
+        return value
+
+    def flush(self) -> None:
+        """Commits the pending writes to disk."""
+        with self._lock:
+            if self._db is not None and self._n_pending:
+                self._db.commit()
+                self._n_pending = 0
+
+    def clear(self) -> None:
+        """Removes all the entries, in memory and on disk, and resets the statistics."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+                self._db.commit()
+                self._n_pending = 0
+            self.hits = self.disk_hits = self.misses = 0
+
+    def close(self) -> None:
+        """Commits the pending writes and closes the database."""
+        with self._lock:
+            if self._db is not None:
+                self.flush()
+                self._db.close()
+                self._db = None
+
+    def _set_memory(self, key: str, value: Any) -> None:
+        """Stores a value in memory, evicting the least recently used entries if needed."""
+        if self.maxsize == 0:
+            return
+
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
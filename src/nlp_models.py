@@ -0,0 +1,87 @@
+"""This module loads the spacy models used to process the reports.
+
+Spacy and negspacy are only imported when a model is loaded, and each model is loaded with only the components needed
+by its task (see PipelineProfile), so short jobs and worker processes start quickly.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from src.const.pipelines import PipelineProfile
+
+if TYPE_CHECKING:
+    import spacy
+    from negspacy.termsets import termset
+
+
+MODEL_NAME = "en_core_sci_lg"
+MODEL_URL = "https://s3-us-west-2.amazonaws.com/ai2-s2-scispacy/releases/v0.5.0/en_core_sci_lg-0.5.0.tar.gz"
+
+# Components of the model that are not loaded for each profile
+EXCLUDED_COMPONENTS = {
+    PipelineProfile.FULL: [],
+    # Negex needs the entities and the sentence boundaries, which this model only gets from the parser
+    PipelineProfile.NEGATION: ["tagger", "attribute_ruler", "lemmatizer"],
+    PipelineProfile.LEMMA: ["parser", "ner"],
+    PipelineProfile.TOKENIZER: ["tok2vec", "tagger", "attribute_ruler", "lemmatizer", "parser", "ner"],
+}
+
+# Profiles that need the negex component
+NEGATION_PROFILES = [PipelineProfile.FULL, PipelineProfile.NEGATION]
+
+
+def get_negation_patterns() -> termset:
+    """Returns the negation patterns."""
+    from negspacy.termsets import termset
+
+    ts = termset("en_clinical")
+    ts.add_patterns({
+        "preceding_negations": ["no obvious", "normal appearance of the"],
+        "following_negations": ["normal"]
+    })
+
+    return ts
+
+
+@lru_cache()
+def get_nlp_model(profile: str = PipelineProfile.NEGATION) -> spacy.language.Language:
+    """Returns the spacy model.
+
+    The model is loaded only once per process and profile.
+
+    Args:
+        profile: Components to load. See PipelineProfile.
+
+    Returns:
+        The spacy model.
+
+    """
+    if profile not in EXCLUDED_COMPONENTS:
+        raise ValueError(f"profile must be one of {list(EXCLUDED_COMPONENTS)}")
+
+    import spacy
+
+    spacy.prefer_gpu()
+
+    try:
+        nlp = spacy.load(MODEL_NAME, exclude=EXCLUDED_COMPONENTS[profile])
+    except:
+        # This is only for streamlit
+        import subprocess
+        subprocess.run(["pip", "install", MODEL_URL])
+        nlp = spacy.load(MODEL_NAME, exclude=EXCLUDED_COMPONENTS[profile])
+
+    if profile in NEGATION_PROFILES:
+        # Registers the negex factory
+        from negspacy.negation import Negex
+
+        ts = get_negation_patterns()
+        nlp.add_pipe(
+            "negex",
+            config={
+                "neg_termset": ts.get_patterns()
+            }
+        )
+
+    return nlp
@@ -0,0 +1,218 @@
+"""This module prunes the labels that can't reach the threshold of the fuzzy match before computing their scores.
+
+An inverted index from the character n-grams (bigrams by default) of the labels to the labels and the positions where
+they appear is built once. For each text, an n-gram of the text at position j that appears in a label at position p
+is a hit on the diagonal j - p of that label. The labels with enough hits on nearby diagonals are the candidates, and
+only they are scored.
+
+By default the number of hits required is a lower bound derived from the threshold: a label whose partial ratio with
+the text is at least the threshold always has that many hits within a band of diagonals, so no match is lost. The
+bound gets looser as the threshold decreases: it prunes most labels at 90, about half at 80 and almost none at 70,
+and a warning is shown if it can't prune any label. A minimum overlap ratio can be given instead to prune more
+aggressively at the cost of possibly losing some matches.
+"""
+from __future__ import annotations
+
+import math
+import warnings
+
+import numpy as np
+
+# Bits per character of the integer codes of the n-grams (enough for all the Unicode code points)
+_CHAR_BITS = 21
+_MAX_N = 64 // _CHAR_BITS
+
+
+def encode_ngrams(text: str, n: int = 2) -> np.ndarray:
+    """Encodes the character n-grams of a text as integers, in order.
+
+    Args:
+        text: Text to split.
+        n: Number of characters of each n-gram. At most 3.
+
+    Returns:
+        An array with the code of each n-gram. It is empty if the text is shorter than n.
+
+    """
+    chars = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n_ngrams = max(len(chars) - n + 1, 0)
+
+    codes = np.zeros(n_ngrams, dtype=np.uint64)
+    for k in range(n):
+        codes = (codes << np.uint64(_CHAR_BITS)) | chars[k:k + n_ngrams]
+
+    return codes
+
+
+def get_min_shared_ngrams(label_length: int, n: int, threshold: float) -> int:
+    """Computes the minimum number of n-grams of a label that appear, in place, in any window of a text where its
+    partial ratio is at least the threshold.
+
+    The partial ratio is the highest ratio between the label (of length L) and a window of the text of length W <= L,
+    which is 2 * M / (L + W) for M matching characters. Each label character without match destroys at most n
+    n-grams of the label, and each window character without match at most n - 1, so at least
+    (L - n + 1) - (n * (L - M) + (n - 1) * (W - M)) n-grams of the label are preserved. This is minimized over all the
+    windows that can reach the threshold.
+
+    Args:
+        label_length: Number of characters of the label.
+        n: Number of characters of each n-gram.
+        threshold: Threshold of the partial ratio (0-100).
+
+    Returns:
+        The minimum number of preserved n-grams. It is 0 or less if the label can't be pruned.
+
+    """
+    if threshold <= 0 or label_length < n:
+        return 0
+
+    t = min(threshold, 100) / 100
+    min_window = t * label_length / (2 - t)
+
+    # The number of destroyed n-grams is linear in the window length, so its maximum is at one of the extremes
+    max_destroyed = 0.0
+    for window in (min_window, label_length):
+        matches = t * (label_length + window) / 2
+        destroyed = n * (label_length - matches) + (n - 1) * (window - matches)
+        max_destroyed = max(max_destroyed, destroyed)
+
+    return label_length - n + 1 - math.floor(max_destroyed + 1e-9)
+
+
+def get_max_diagonal_band(label_length: int, threshold: float) -> int:
+    """Computes the maximum width of the band of diagonals of the preserved n-grams of a label.
+
+    Along the alignment of the label with a window, the diagonal only changes with the characters without match, and
+    there are at most L + W - 2 * M <= (1 - t) * 2 * L of them.
+
+    Args:
+        label_length: Number of characters of the label.
+        threshold: Threshold of the partial ratio (0-100).
+
+    Returns:
+        The width of the band.
+
+    """
+    t = min(max(threshold, 0), 100) / 100
+
+    return math.floor((1 - t) * 2 * label_length + 1e-9)
+
+
+class NgramLabelIndex:
+    """Inverted index from the character n-grams of the labels to the labels and the positions where they appear.
+
+    Attributes:
+        labels: Pathology labels.
+        n: Number of characters of each n-gram.
+        n_checked: Number of (text, label) pairs checked by the prefilter.
+        n_candidates: Number of (text, label) pairs that passed the prefilter.
+
+    """
+    def __init__(self, labels: list[str], n: int = 2) -> None:
+        """Initializes a NgramLabelIndex object."""
+        if not 1 <= n <= _MAX_N:
+            raise ValueError(f"n must be between 1 and {_MAX_N}, not {n}")
+
+        self.labels = labels
+        self.n = n
+
+        self._lengths = np.array([len(x) for x in labels], dtype=np.int64)
+        self._n_positions = np.maximum(self._lengths - n + 1, 0)
+
+        # The postings are stored in CSR format: the hits of the n-gram with code _codes[k] are the labels
+        # _label_idx[_indptr[k]:_indptr[k + 1]] at the positions _positions[_indptr[k]:_indptr[k + 1]]
+        label_codes = [encode_ngrams(x, n) for x in labels]
+        codes = np.concatenate(label_codes) if labels else np.array([], dtype=np.uint64)
+        label_idx = np.repeat(np.arange(len(labels)), [len(x) for x in label_codes])
+        positions = np.concatenate([np.arange(len(x)) for x in label_codes]) if labels else label_idx
+
+        order = np.argsort(codes, kind="stable")
+        self._codes, counts = np.unique(codes[order], return_counts=True)
+        self._indptr = np.concatenate([[0], np.cumsum(counts)])
+        self._label_idx = label_idx[order]
+        self._positions = positions[order]
+
+        self._params = {}
+        self.n_checked = 0
+        self.n_candidates = 0
+
+    @property
+    def pruning_ratio(self) -> float:
+        """Gets the fraction of the (text, label) pairs that were pruned."""
+        return 1 - self.n_candidates / self.n_checked if self.n_checked else 0.0
+
+    def get_min_shared(self, threshold: float, min_overlap_ratio: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Gets the minimum number of hits of each label within a band of diagonals to be a candidate.
+
+        Args:
+            threshold: Threshold of the partial ratio (0-100).
+            min_overlap_ratio: If given, the fraction of the n-grams of each label that must be hits, instead of the
+                lossless bound.
+
+        Returns:
+            A tuple with an array with the minimum number of hits of each label and an array with the width of the
+            band of diagonals of each label.
+
+        """
+        key = (threshold, min_overlap_ratio)
+        if key not in self._params:
+            if min_overlap_ratio is None:
+                min_shared = np.array([get_min_shared_ngrams(x, self.n, threshold) for x in self._lengths],
+                                      dtype=np.int64)
+                if len(min_shared) and (min_shared <= 0).all():
+                    warnings.warn(f"The prefilter can't prune any label with threshold {threshold}. Give "
+                                  f"min_overlap_ratio to prune with a heuristic.")
+            else:
+                min_shared = np.ceil(self._n_positions * min_overlap_ratio).astype(np.int64)
+
+            bands = np.array([get_max_diagonal_band(x, threshold) for x in self._lengths], dtype=np.int64)
+            self._params[key] = (min_shared, bands)
+
+        return self._params[key]
+
+    def get_candidates(self, text: str, threshold: float, min_overlap_ratio: float | None = None) -> np.ndarray:
+        """Gets the labels that could have a partial ratio with the text at least as high as the threshold.
+
+        Args:
+            text: Text to look in.
+            threshold: Threshold of the partial ratio (0-100).
+            min_overlap_ratio: See `get_min_shared`.
+
+        Returns:
+            A sorted array with the positions of the candidate labels.
+
+        """
+        min_shared, bands = self.get_min_shared(threshold, min_overlap_ratio)
+
+        # Labels longer than the text are swapped with it by the partial ratio, so the bound doesn't apply to them
+        is_candidate = (min_shared <= 0) | (self._lengths > len(text))
+
+        # Finds the n-grams of the text that are in the index and expands their postings into hits
+        text_codes = encode_ngrams(text, self.n)
+        k = np.minimum(np.searchsorted(self._codes, text_codes), max(len(self._codes) - 1, 0))
+        is_found = self._codes[k] == text_codes if len(self._codes) else np.zeros(len(text_codes), dtype=bool)
+        text_positions, k = np.flatnonzero(is_found), k[is_found]
+
+        starts, counts = self._indptr[k], self._indptr[k + 1] - self._indptr[k]
+        if counts.sum():
+            hit_idx = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            label_idx = self._label_idx[hit_idx]
+            diagonals = np.repeat(text_positions, counts) - self._positions[hit_idx]
+
+            # The hits are sorted by label and diagonal, and for each hit, the hits of the same label up to the end of
+            # the band that starts at its diagonal are counted
+            offset = int(self._lengths.max())
+            span = len(text) + offset + int(bands.max()) + 1
+            keys = np.sort(label_idx * span + diagonals + offset)
+            n_in_band = np.searchsorted(keys, keys + bands[keys // span], side="right") - np.arange(len(keys))
+
+            max_in_band = np.zeros(len(self.labels), dtype=np.int64)
+            np.maximum.at(max_in_band, keys // span, n_in_band)
+            is_candidate |= max_in_band >= min_shared
+
+        candidates = np.flatnonzero(is_candidate)
+
+        self.n_checked += len(self.labels)
+        self.n_candidates += len(candidates)
+
+        return candidates
@@ -0,0 +1,206 @@
+"""This module contains indexes over a list of reports, so that subsets of the corpus can be selected by position
+without scanning all the reports."""
+from __future__ import annotations
+
+import math
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
+from src.const.body_sections import BodySection
+from src.report_manager import Report
+
+_EMPTY = np.array([], dtype=np.int64)
+
+# Fields of the reports with accession numbers, in the order they are looked up. They have the same names as the
+# columns of the files exported for the annotation tool (see save_impressions.py)
+ACCESSION_FIELDS = ("orig_acc", "anon_acc", "anon_acc_1", "anon_acc_2")
+
+
+def build_inverted_index(keys: Iterable) -> dict:
+    """Builds an inverted index from keys to the positions where they appear.
+
+    Args:
+        keys: One key per position. Missing keys are not indexed.
+
+    Returns:
+        A dictionary from each key to a sorted array of positions.
+
+    """
+    keys = pd.Series(list(keys), dtype=object)
+
+    return keys.groupby(keys).indices
+
+
+def normalize_accession(value) -> str | None:
+    """Normalizes an accession number so that the same number read from different files has the same key.
+
+    Accession numbers read by pandas from columns with missing values are floats (e.g. 19032699.0).
+
+    Args:
+        value: Accession number as a number or a string.
+
+    Returns:
+        The accession number as a string of digits, or None if it is missing.
+
+    """
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+
+    value = str(value).strip()
+    if value.endswith(".0") and value[:-2].isdigit():
+        value = value[:-2]
+
+    return value or None
+
+
+def intersect_positions(positions: list[np.ndarray], n: int) -> np.ndarray:
+    """Intersects the positions returned by several inverted indexes.
+
+    Args:
+        positions: Sorted arrays of positions.
+        n: Number of indexed items, used when there is nothing to intersect.
+
+    Returns:
+        A sorted array with the positions present in all the arrays, or all the positions if no array is given.
+
+    """
+    if not positions:
+        return np.arange(n)
+
+    result = positions[0]
+    for other in positions[1:]:
+        result = np.intersect1d(result, other, assume_unique=True)
+
+    return result
+
+
+class SectionIndex:
+    """Categorical codes and inverted index of the body section and modality of the reports.
+
+    Attributes:
+        body_section: Categorical with the body section of each report.
+        modality: Categorical with the modality of each report.
+
+    """
+    def __init__(self, body_sections: list[str], modalities: list[str | None]) -> None:
+        """Initializes a SectionIndex object."""
+        self.body_section = pd.Categorical(body_sections, categories=BodySection.get_sections())
+        self.modality = pd.Categorical(modalities)
+        self._positions = {
+            "body_section": build_inverted_index(body_sections),
+            "modality": build_inverted_index(modalities),
+        }
+
+    @classmethod
+    def from_reports(cls, reports: list[Report]) -> SectionIndex:
+        """Builds the index of a list of reports.
+
+        Args:
+            reports: Reports to index.
+
+        Returns:
+            The index.
+
+        """
+        return cls([x.body_section for x in reports], [x.modality for x in reports])
+
+    def __len__(self) -> int:
+        return len(self.body_section)
+
+    def get_positions(self, body_section: str | None = None, modality: str | None = None) -> np.ndarray:
+        """Gets the positions of the reports of a body section and/or modality.
+
+        Args:
+            body_section: Body section of the reports.
+            modality: Modality of the reports.
+
+        Returns:
+            A sorted array with the positions of the reports.
+
+        """
+        return intersect_positions([self._positions[key].get(value, _EMPTY) for key, value in
+                                    (("body_section", body_section), ("modality", modality)) if value is not None],
+                                   len(self))
+
+    def get_reports(self, reports: list[Report], body_section: str | None = None,
+                    modality: str | None = None) -> list[Report]:
+        """Gets the reports of a body section and/or modality.
+
+        Args:
+            reports: The reports used to build the index.
+            body_section: Body section of the reports.
+            modality: Modality of the reports.
+
+        Returns:
+            A list of Report objects.
+
+        """
+        return [reports[i] for i in self.get_positions(body_section, modality)]
+
+
+class AccessionIndex:
+    """Hash index from the accession numbers of the reports to their positions."""
+    def __init__(self, accessions: dict[str, list]) -> None:
+        """Initializes an AccessionIndex object.
+
+        Args:
+            accessions: Dictionary from each accession field to the accession numbers of all the reports.
+
+        """
+        self._positions = {field: build_inverted_index(normalize_accession(x) for x in values)
+                           for field, values in accessions.items()}
+
+    @classmethod
+    def from_reports(cls, reports: list[Report]) -> AccessionIndex:
+        """Builds the index of a list of reports.
+
+        Args:
+            reports: Reports to index.
+
+        Returns:
+            The index.
+
+        """
+        return cls({field: [getattr(x, field) for x in reports] for field in ACCESSION_FIELDS})
+
+    def get_positions(self, value, field: str = "orig_acc") -> np.ndarray:
+        """Gets the positions of the reports with an accession number.
+
+        Args:
+            value: Accession number.
+            field: Accession field to look in. One of ACCESSION_FIELDS.
+
+        Returns:
+            A sorted array with the positions of the reports. It is empty if no report has the accession number.
+
+        """
+        key = normalize_accession(value)
+        if key is None:
+            return _EMPTY
+
+        return self._positions[field].get(key, _EMPTY)
+
+    def find(self, accessions: dict) -> np.ndarray:
+        """Finds the reports of a record with one or more accession numbers (e.g. an exported annotation).
+
+        The accession fields are tried in the order of ACCESSION_FIELDS and the first one that matches is used.
+
+        Args:
+            accessions: Dictionary from accession field to accession number. Other keys are ignored.
+
+        Returns:
+            A sorted array with the positions of the reports. It is empty if no report matches.
+
+        """
+        for field in ACCESSION_FIELDS:
+            if field in accessions and field in self._positions:
+                positions = self.get_positions(accessions[field], field)
+                if len(positions):
+                    return positions
+
+        return _EMPTY
@@ -1,6 +1,5 @@
 import warnings
 import re
-from functools import lru_cache
 
 from src.const.body_sections import BodySection
 
@@ -26,6 +25,9 @@ class Report:
     headers = ["examination", "clinical indication", "history", "technique", "comparison", "electronic signature"]
     impression_token = "impression:"
     electronic_signature_token = "electronic signature"
+    same_author_token = "dictated by and signed by"
+    dictator_pattern = re.compile(r"dictated by(.*?)and signed by")
+    signer_pattern = re.compile(r"signed by(.*?)\d")
 
     def __init__(self, text: str, orig_filename: str, week: int, day: int, modality: str, exam_description: str,
                  reason: str, orig_acc: str, anon_acc: str, anon_acc_1: str, anon_acc_2: str,
@@ -44,9 +46,15 @@ class Report:
         self.anon_acc_2 = anon_acc_2
         self.gt_pathology = gt_pathology.lower() if gt_pathology is not None else None
 
+        # The body section is resolved once, since it is needed every time the reports are filtered or grouped
+        self._body_section = BodySection.get_section(self.orig_filename)
+
         # This will be assigned later by a non-human model
         self.pred_pathology = None
 
+        # Cache of the dictator and signer, extracted the first time they are requested
+        self._authors = None
+
     def is_prediction_right(self) -> bool | None:
         """Checks whether the predicted pathology is the same as the ground truth."""
         if self.gt_pathology is None:
@@ -81,7 +89,25 @@ class Report:
             The body section.
 
         """
-        return BodySection.get_section(self.orig_filename)
+        return self._body_section
+
+    def get_text(self, look_in: str = "impression") -> str:
+        """Returns the text of the report where the pathology will be looked for.
+
+        Args:
+            look_in: Text to look in. Either "impression" to look only in the impression section or "report" to look in
+                the whole report.
+
+        Returns:
+            The text to look in.
+
+        """
+        if look_in == "impression":
+            return self.get_impression()
+        elif look_in == "report":
+            return self.text
+        else:
+            raise ValueError(f"look_in must be 'impression' or 'report'")
 
     def get_impression(self) -> str:
         """Returns the impression section of the report."""
@@ -89,21 +115,10 @@ class Report:
             warnings.warn("This report has no impression section.")
             return ""
 
-        words_list = []
-        is_impression = False
-        for token in self.text.split():
-            # Check for end of section and break
-            if any(x in token for x in self.headers):
-                break
-
-            if is_impression:
-                words_list.append(token)
-
-            # Find start of section
-            if self.impression_token in token:
-                is_impression = True
+        tokens = self.text.split()
+        start, end = self.get_impression_span(tokens)
 
-        return " ".join(words_list)
+        return " ".join(tokens[start:end])
 
     def get_electronic_signature(self) -> str:
         """Returns the electronic signature section of the report."""
@@ -111,40 +126,89 @@ class Report:
             warnings.warn("This report has no electronic signature section.")
             return ""
 
-        # We assume that the electronic signature is the last section of the report
-        words_list = []
-        is_electronic_signature = False
-        for bigram in self.get_bigrams(self.text):
-            if is_electronic_signature:
-                # Append only second token of brigram to not create duplication
-                words_list.append(bigram.split()[1])
+        tokens = self.text.split()
+        start, end = self.get_electronic_signature_span(tokens)
+
+        return " ".join(tokens[start:end])
+
+    @classmethod
+    def get_impression_span(cls, tokens: list[str]) -> tuple[int, int]:
+        """Finds the impression section in the tokens of a report.
+
+        Args:
+            tokens: Tokens of the report text split by whitespaces.
+
+        Returns:
+            The start and end positions of the section, such that the section is tokens[start:end]. Both positions are 0
+            if there is no impression section.
+
+        """
+        start = None
+        for i, token in enumerate(tokens):
+            # Check for end of section and break
+            if any(x in token for x in cls.headers):
+                return (start, i) if start is not None else (0, 0)
 
             # Find start of section
-            if self.electronic_signature_token in bigram:
-                is_electronic_signature = True
+            if start is None and cls.impression_token in token:
+                start = i + 1
+
+        return (start, len(tokens)) if start is not None else (0, 0)
+
+    @classmethod
+    def get_electronic_signature_span(cls, tokens: list[str]) -> tuple[int, int]:
+        """Finds the electronic signature section in the tokens of a report.
+
+        Args:
+            tokens: Tokens of the report text split by whitespaces.
+
+        Returns:
+            The start and end positions of the section, such that the section is tokens[start:end]. Both positions are 0
+            if there is no electronic signature section.
+
+        """
+        # We assume that the electronic signature is the last section of the report and that it starts after the first
+        # bigram that contains the electronic signature token
+        for i, bigram in enumerate(cls.get_bigrams(" ".join(tokens))):
+            if cls.electronic_signature_token in bigram:
+                return i + 2, len(tokens)
 
-        return " ".join(words_list)
+        return 0, 0
 
-    @lru_cache()
     def get_authors(self) -> tuple[str, str]:
         """Gets the doctors that dictated and signed the report.
 
         They can be the same person.
 
         Returns:
-            Tuple with the names of the dictator and the signer.
+            Tuple with the names of the dictator and the signer. The names are empty strings if they can't be found.
 
         """
+        if self._authors is None:
+            self._authors = self._extract_authors()
+
+        return self._authors
+
+    def _extract_authors(self) -> tuple[str, str]:
+        """Extracts the dictator and the signer from the electronic signature section."""
         electronic_signature = self.get_electronic_signature()
 
+        signer_match = self.signer_pattern.search(electronic_signature)
+        if signer_match is None:
+            warnings.warn("The signer of this report could not be found.")
+            return "", ""
+        signer = signer_match.group(1).strip()
+
         # Case 1: same author
-        if "dictated by and signed by" in electronic_signature:
-            dictator = signer = re.search(r'signed by(.*?)\d', electronic_signature).group(1).strip()
-        else:
-            dictator = re.search(r'dictated by(.*?)and signed by', electronic_signature).group(1).strip()
-            signer = re.search(r'signed by(.*?)\d', electronic_signature).group(1).strip()
+        if self.same_author_token in electronic_signature:
+            return signer, signer
+
+        dictator_match = self.dictator_pattern.search(electronic_signature)
+        if dictator_match is None:
+            warnings.warn("The dictator of this report could not be found.")
+            return "", signer
 
-        return dictator, signer
+        return dictator_match.group(1).strip(), signer
 
     def get_dictator(self) -> str:
         """Gets the doctor that dictated the report.
@@ -0,0 +1,351 @@
+"""This module labels the reports in parallel by splitting the corpus into shards, either by body section or in chunks
+of fixed size.
+
+Each shard is labeled in a worker process that loads the spaCy model only once, when the process starts. The shards
+can be run in a local process pool or through a file-based work queue, so that several machines sharing a filesystem
+can work on the same corpus. In both cases, the results are merged in the original order of the reports.
+
+If a TextStore of the reports is given, only the store (which is pickled as its path) and the positions of each shard
+are sent to the workers, instead of the Report objects. Each worker maps the same file and reads only the section its
+matcher looks in, so the memory used by the texts doesn't grow with the number of workers.
+"""
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import socket
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from copy import deepcopy
+from pathlib import Path
+
+import numpy as np
+
+from src.main import exact_match, fuzzy_match
+from src.nlp_models import get_nlp_model
+from src.report_index import build_inverted_index
+from src.report_manager import Report
+from src.text_store import TextStore
+
+
+def make_shards(reports: list[Report], shard_by: str = "body_section", shard_size: int | None = None) -> list[np.ndarray]:
+    """Splits the reports into shards.
+
+    Args:
+        reports: Reports to split.
+        shard_by: Either "body_section" to have one shard per body section or "size" to have shards of fixed size.
+        shard_size: Maximum number of reports per shard. Required if shard_by is "size". If given with "body_section",
+            the body sections larger than this are split further.
+
+    Returns:
+        A list with the positions of the reports of each shard, in a deterministic order.
+
+    """
+    if shard_by == "body_section":
+        groups = build_inverted_index([x.body_section for x in reports])
+        positions = [groups[k] for k in sorted(groups)]
+    elif shard_by == "size":
+        if shard_size is None:
+            raise ValueError("shard_size must be given to shard by size")
+        positions = [np.arange(len(reports))]
+    else:
+        raise ValueError(f"shard_by must be 'body_section' or 'size'")
+
+    if shard_size is None:
+        return positions
+
+    return [x[start:start + shard_size] for x in positions for start in range(0, len(x), shard_size)]
+
+
+def _label_shard(reports: list[Report], labels: list[str], method: str, match_kwargs: dict) -> list[str]:
+    """Labels the reports of a shard with the spacy model of the current process.
+
+    Returns:
+        A list with the predicted pathologies.
+
+    """
+    matchers = {"exact": exact_match, "fuzzy": fuzzy_match}
+    if method not in matchers:
+        raise ValueError(f"method must be one of {list(matchers)}")
+
+    preds = matchers[method](reports, labels, nlp=get_nlp_model(), **match_kwargs)
+
+    return [x.pred_pathology for x in preds]
+
+
+class _StoredSection:
+    """Section of a report read from a TextStore, with the interface of Report that the matchers use."""
+    def __init__(self, text: str, look_in: str) -> None:
+        """Initializes a _StoredSection object."""
+        self._text = text
+        self._look_in = look_in
+        self.pred_pathology = None
+
+    def get_text(self, look_in: str = "impression") -> str:
+        """Gets the stored section. Only the section read from the store is available."""
+        if look_in != self._look_in:
+            raise ValueError(f"Only the {self._look_in!r} section was read from the text store")
+
+        return self._text
+
+
+def _label_stored_shard(text_store: TextStore, positions: np.ndarray, labels: list[str], method: str,
+                        match_kwargs: dict) -> list[str]:
+    """Labels the reports of a shard reading only the section the matcher looks in from a text store.
+
+    Returns:
+        A list with the predicted pathologies.
+
+    """
+    look_in = match_kwargs.get("look_in", "impression")
+    sections = [_StoredSection(x, look_in) for x in text_store.get_texts(look_in, positions)]
+
+    return _label_shard(sections, labels, method, match_kwargs)
+
+
+def _merge_predictions(reports: list[Report], shard_results: list[tuple[np.ndarray, list[str]]]) -> list[Report]:
+    """Assigns the predictions of all the shards to a copy of the reports in their original order."""
+    preds = np.full(len(reports), None, dtype=object)
+    for positions, shard_preds in shard_results:
+        if len(positions) and positions.max() >= len(reports):
+            raise RuntimeError("The shards don't belong to these reports")
+        preds[positions] = shard_preds
+
+    n_missing = sum(x is None for x in preds)
+    if n_missing:
+        raise RuntimeError(f"{n_missing} reports have no prediction")
+
+    reports_copy = deepcopy(reports)
+    for report, pred in zip(reports_copy, preds):
+        report.pred_pathology = pred
+
+    return reports_copy
+
+
+def sharded_match(reports: list[Report], labels: list[str], method: str = "exact", shard_by: str = "body_section",
+                  shard_size: int | None = None, n_workers: int | None = None, text_store: TextStore | None = None,
+                  **match_kwargs) -> list[Report]:
+    """Finds the pathology of each report running the shards in a local pool of processes.
+
+    Args:
+        reports: Reports to label.
+        labels: Possible pathology labels.
+        method: Matcher to use. Either "exact" or "fuzzy".
+        shard_by: Either "body_section" or "size". See `make_shards`.
+        shard_size: Maximum number of reports per shard. See `make_shards`.
+        n_workers: Number of worker processes. If None, one per CPU.
+        text_store: Text store built from the same reports, in the same order. If given, the workers read the texts
+            from it instead of receiving the reports. Its sections are whitespace-normalized (see TextStore).
+        **match_kwargs: Other arguments of the matcher, e.g. look_in or threshold.
+
+    Returns:
+        A list of Report objects with the predicted pathologies, in the same order as the input reports.
+
+    """
+    _check_text_store(reports, text_store)
+    shards = make_shards(reports, shard_by, shard_size)
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=get_nlp_model) as executor:
+        if text_store is not None:
+            futures = [executor.submit(_label_stored_shard, text_store, positions, labels, method, match_kwargs)
+                       for positions in shards]
+        else:
+            futures = [executor.submit(_label_shard, [reports[i] for i in positions], labels, method, match_kwargs)
+                       for positions in shards]
+        shard_results = [(positions, future.result()) for positions, future in zip(shards, futures)]
+
+    return _merge_predictions(reports, shard_results)
+
+
+def create_work_queue(reports: list[Report], queue_dir: str | Path, shard_by: str = "body_section",
+                      shard_size: int | None = None, text_store: TextStore | None = None) -> int:
+    """Writes the shards of the reports into a directory that acts as a work queue.
+
+    The queue directory has three subdirectories: "pending" with the shards not labeled yet, "claimed" with the shards
+    being labeled by a worker and "done" with the results of the labeled shards. A manifest with the number of shards
+    and reports is written next to them.
+
+    Args:
+        reports: Reports to label.
+        queue_dir: Directory of the queue. It must be in a filesystem shared by all the workers, and it must be new or
+            empty so that the results of a previous queue are never merged.
+        shard_by: Either "body_section" or "size". See `make_shards`.
+        shard_size: Maximum number of reports per shard. See `make_shards`.
+        text_store: Text store built from the same reports, in the same order, in a filesystem shared by all the
+            workers. If given, the shards only contain the positions of their reports and the path of the store.
+
+    Returns:
+        The number of shards.
+
+    """
+    queue_dir = Path(queue_dir).resolve()
+    if queue_dir.exists() and any(queue_dir.iterdir()):
+        raise ValueError(f"The queue directory {queue_dir} is not empty")
+
+    for name in ("pending", "claimed", "done"):
+        (queue_dir / name).mkdir(parents=True, exist_ok=True)
+
+    _check_text_store(reports, text_store)
+    shards = make_shards(reports, shard_by, shard_size)
+    for i, positions in enumerate(shards):
+        shard = text_store if text_store is not None else [reports[j] for j in positions]
+        _write_pickle(queue_dir / "pending" / _get_shard_name(i), (positions, shard))
+
+    # The manifest is written last, so a queue with a manifest has all its shards
+    with open(queue_dir / "manifest.json", "w") as f:
+        json.dump({"n_shards": len(shards), "n_reports": len(reports)}, f)
+
+    return len(shards)
+
+
+def run_queue_worker(queue_dir: str | Path, labels: list[str], method: str = "exact", **match_kwargs) -> int:
+    """Labels shards from a work queue until there are no pending shards left.
+
+    Many workers, in the same or different machines, can run this function on the same queue at the same time. A shard
+    is claimed by atomically moving it from "pending" to "claimed", so only one worker labels each shard. If a worker
+    dies, its claimed shards can be moved back to "pending" with `requeue_stale_shards`.
+
+    Args:
+        queue_dir: Directory of the queue created with `create_work_queue`.
+        labels: Possible pathology labels.
+        method: Matcher to use. Either "exact" or "fuzzy".
+        **match_kwargs: Other arguments of the matcher, e.g. look_in or threshold.
+
+    Returns:
+        The number of shards labeled by this worker.
+
+    """
+    queue_dir = Path(queue_dir).resolve()
+    worker_id = f"{socket.gethostname()}_{os.getpid()}"
+
+    n_labeled = 0
+    for pending_file in sorted((queue_dir / "pending").glob("shard_*.pkl")):
+        claimed_file = queue_dir / "claimed" / f"{pending_file.stem}.{worker_id}.pkl"
+        try:
+            os.rename(pending_file, claimed_file)
+        except FileNotFoundError:
+            # Another worker claimed this shard first
+            continue
+
+        # The modification time of the claimed file is the time of the claim (see `requeue_stale_shards`)
+        try:
+            os.utime(claimed_file)
+            data = claimed_file.read_bytes()
+        except FileNotFoundError:
+            # The shard was requeued right after the claim
+            continue
+
+        # A shard with a text store opens it when it is unpickled
+        positions, shard = pickle.loads(data)
+
+        if isinstance(shard, TextStore):
+            preds = _label_stored_shard(shard, positions, labels, method, match_kwargs)
+        else:
+            preds = _label_shard(shard, labels, method, match_kwargs)
+        _write_pickle(queue_dir / "done" / pending_file.name, (positions, preds))
+        # If the shard was requeued meanwhile, it is labeled again with the same result
+        claimed_file.unlink(missing_ok=True)
+        n_labeled += 1
+
+    return n_labeled
+
+
+def requeue_stale_shards(queue_dir: str | Path, max_age: float) -> int:
+    """Moves the shards claimed too long ago back to "pending", e.g. because their worker died.
+
+    If the worker of a requeued shard is still alive, the shard is labeled twice with the same result, so max_age
+    should be well above the time to label a shard.
+
+    Args:
+        queue_dir: Directory of the queue created with `create_work_queue`.
+        max_age: Seconds after which a claimed shard is considered stale.
+
+    Returns:
+        The number of shards requeued.
+
+    """
+    queue_dir = Path(queue_dir).resolve()
+    now = time.time()
+
+    n_requeued = 0
+    for claimed_file in sorted((queue_dir / "claimed").glob("shard_*.pkl")):
+        try:
+            if now - claimed_file.stat().st_mtime < max_age:
+                continue
+            # The name of the claimed file is "shard_XXXXX.<worker id>.pkl"
+            os.rename(claimed_file, queue_dir / "pending" / f"{claimed_file.name.split('.')[0]}.pkl")
+        except FileNotFoundError:
+            # The shard was finished or requeued meanwhile
+            continue
+        n_requeued += 1
+
+    return n_requeued
+
+
+def merge_queue_results(reports: list[Report], queue_dir: str | Path) -> list[Report]:
+    """Merges the results of a work queue once all its shards have been labeled.
+
+    Args:
+        reports: The reports used to create the queue.
+        queue_dir: Directory of the queue.
+
+    Returns:
+        A list of Report objects with the predicted pathologies, in the same order as the input reports.
+
+    """
+    queue_dir = Path(queue_dir).resolve()
+
+    with open(queue_dir / "manifest.json") as f:
+        manifest = json.load(f)
+    if manifest["n_reports"] != len(reports):
+        raise ValueError(f"The queue was created with {manifest['n_reports']} reports, not {len(reports)}")
+
+    shard_names = [_get_shard_name(i) for i in range(manifest["n_shards"])]
+    unfinished = [x for x in shard_names if not (queue_dir / "done" / x).exists()]
+    if unfinished:
+        raise RuntimeError(f"{len(unfinished)} shards have not been labeled yet")
+
+    shard_results = []
+    for name in shard_names:
+        with open(queue_dir / "done" / name, "rb") as f:
+            shard_results.append(pickle.load(f))
+
+    return _merge_predictions(reports, shard_results)
+
+
+def _check_text_store(reports: list[Report], text_store: TextStore | None) -> None:
+    """Checks that a text store has as many reports as the reports to label."""
+    if text_store is not None and len(text_store) != len(reports):
+        raise ValueError(f"The text store has {len(text_store)} reports, not {len(reports)}")
+
+
+def _get_shard_name(i: int) -> str:
+    """Gets the file name of a shard of a work queue."""
+    return f"shard_{i:05d}.pkl"
+
+
+def _write_pickle(path: Path, obj) -> None:
+    """Writes an object atomically, so that readers never see a partially written file.
+
+    Each writer uses its own temporary file, so several workers can write the same file (e.g. a requeued shard) at the
+    same time: the last replacement wins and the file is always complete.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f"{path.stem}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
+if __name__ == '__main__':
+    from src.data_preparation.loaders import load_pathology_labels, load_reports
+
+    labels_ = load_pathology_labels("src/data_preparation/data/pathology_labels/pathology_labels.csv")
+    reports_ = load_reports("src/data_preparation/data/merged_crosswalks_csv/sdr_crosswalks.csv")
+
+    preds_exact_impression = sharded_match(reports_, labels_, "exact", look_in="impression")
@@ -0,0 +1,123 @@
+"""This module measures the startup time of the pathology extractor: the time to import its modules, the time to
+load the spacy model with each pipeline profile and the time of the first negation check with each profile that
+detects negations. The negation check also fails if a profile loads but can't detect a negation.
+
+Each measurement runs in a new Python process, so that nothing is already imported or loaded.
+
+Usage (from the root of the repository):
+    python -m src.startup_benchmark
+"""
+from __future__ import annotations
+
+import subprocess
+import sys
+
+from src.nlp_models import EXCLUDED_COMPONENTS, NEGATION_PROFILES
+
+MODULES = ["src.main", "src.data_preparation.loaders", "src.evaluation", "src.classifier", "src.token_fuzzy", "spacy"]
+
+_TIMER_CODE = """
+import time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start)
+"""
+
+# Sentence with a negated pathology, used to check that the negation profiles can run
+NEGATED_PATHOLOGY = "fracture"
+NEGATED_TEXT = "No evidence of fracture."
+
+
+def time_statement(statement: str, setup: str = "", repeat: int = 3) -> float:
+    """Measures the best time of a statement, each time in a new Python process.
+
+    Args:
+        statement: Python code to time.
+        setup: Python code to run before starting the timer.
+        repeat: Number of processes to run.
+
+    Returns:
+        The lowest time in seconds.
+
+    """
+    code = setup + "\n" + _TIMER_CODE.format(statement=statement)
+
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"The statement {statement!r} failed:\n{result.stderr}")
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+
+    return min(times)
+
+
+def time_import(module: str, repeat: int = 3) -> float:
+    """Measures the time to import a module in a new Python process.
+
+    Args:
+        module: Name of the module.
+        repeat: Number of processes to run.
+
+    Returns:
+        The lowest time in seconds.
+
+    """
+    return time_statement(f"import {module}", repeat=repeat)
+
+
+def time_model_load(profile: str, repeat: int = 3) -> float:
+    """Measures the time to load the spacy model with a pipeline profile in a new Python process.
+
+    Spacy itself is imported before starting the timer, so only the model load is measured.
+
+    Args:
+        profile: Pipeline profile. See PipelineProfile.
+        repeat: Number of processes to run.
+
+    Returns:
+        The lowest time in seconds.
+
+    """
+    return time_statement(f"get_nlp_model({profile!r})", setup="import spacy\nfrom src.nlp_models import get_nlp_model",
+                          repeat=repeat)
+
+
+def time_negation_check(profile: str, repeat: int = 3) -> float:
+    """Measures the time of the first negation check with a pipeline profile in a new Python process.
+
+    The model is loaded before starting the timer. The check fails if the model can't run (e.g. a component that
+    negex needs is excluded) or doesn't detect the negation of NEGATED_TEXT.
+
+    Args:
+        profile: Pipeline profile. See PipelineProfile.
+        repeat: Number of processes to run.
+
+    Returns:
+        The lowest time in seconds.
+
+    """
+    statement = (f"assert is_pathology_negated({NEGATED_PATHOLOGY!r}, {NEGATED_TEXT!r}, nlp), "
+                 f"'the negation was not detected'")
+    setup = f"from src.main import is_pathology_negated\nfrom src.nlp_models import get_nlp_model\n" \
+            f"nlp = get_nlp_model({profile!r})"
+
+    return time_statement(statement, setup=setup, repeat=repeat)
+
+
+def main(repeat: int = 3) -> None:
+    print("Import time")
+    for module in MODULES:
+        print(f"{module:35} {time_import(module, repeat):.3f} s")
+
+    print("\nModel load time")
+    for profile in EXCLUDED_COMPONENTS:
+        print(f"{profile:35} {time_model_load(profile, repeat):.3f} s")
+
+    print("\nFirst negation check time")
+    for profile in NEGATION_PROFILES:
+        print(f"{profile:35} {time_negation_check(profile, repeat):.3f} s")
+
+
+if __name__ == '__main__':
+    main()
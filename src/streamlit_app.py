@@ -8,20 +8,28 @@ sys.path.insert(0, os.path.abspath('.'))
 
 from main import load_pathology_labels, load_reports, exact_match, fuzzy_match
 from const.body_sections import BodySection
+from memoization import PredictionCache
 
 st.set_page_config(page_title="AI 4 Resident Education", layout="wide")
 
 
+@st.experimental_singleton
+def get_prediction_cache() -> PredictionCache:
+    """Gets the prediction cache shared by all the sessions and reruns of the app."""
+    return PredictionCache(db_path="src/data_preparation/data/cache/predictions.db")
+
+
 labels = load_pathology_labels("src/data_preparation/data/pathology_labels/pathology_labels.csv")
 reports, non_impression_reports = load_reports("src/data_preparation/data/merged_crosswalks_csv/sdr_crosswalks.csv",
                                                body_section=BodySection.MSK)
+cache = get_prediction_cache()
 
 
 st.title("AI 4 Resident Education")
 
 st.header("Predicted pathologies - Exact Matching")
 
-preds_exact_impression = exact_match(reports, labels, "impression")
+preds_exact_impression = exact_match(reports, labels, "impression", cache=cache)
 df_exact = pd.DataFrame({"Report": [rep.text for rep in preds_exact_impression],
                          "Predicted pathology": [rep.pred_pathology for rep in preds_exact_impression]})
 st.dataframe(df_exact)
@@ -30,9 +38,11 @@ st.dataframe(df_exact)
 st.header("Predicted pathologies - Fuzzy Matching")
 
 thresh = st.slider("Select a threshold for the fuzzy match", 0, 100, 85)
-preds_fuzzy_impression = fuzzy_match(reports, labels, "impression", threshold=thresh)
+preds_fuzzy_impression = fuzzy_match(reports, labels, "impression", threshold=thresh, cache=cache)
 
 df_fuzzy = pd.DataFrame({"Report": [rep.text for rep in preds_fuzzy_impression],
                          "Predicted pathology": [rep.pred_pathology for rep in preds_fuzzy_impression]})
 
 st.dataframe(df_fuzzy, height=800)
+
+st.sidebar.write("Prediction cache", cache.stats)
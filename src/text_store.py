@@ -0,0 +1,185 @@
+"""This module stores the texts of a corpus of reports in a single memory-mapped file.
+
+The normalized texts of all the reports are written one after the other as UTF-8 into one file, together with an
+array of byte offsets that points at each report and at each of its sections. Reading a report or a section is a
+zero-copy slice of the mapping that is only decoded when needed, and all the processes that open the same store share
+the same pages of memory.
+"""
+from __future__ import annotations
+
+import mmap
+import weakref
+from pathlib import Path
+
+import numpy as np
+
+from src.report_manager import Report
+
+
+class TextStore:
+    """Memory-mapped store of the texts of a corpus of reports.
+
+    The store is a directory with two files: "texts.bin" with the UTF-8 texts and "offsets.npy" with the start and end
+    byte offsets of each section of each report.
+
+    Texts are normalized like the sections returned by the Report class (i.e. tokens separated by a single space), so
+    the impression read from the store is the same as `Report.get_impression`.
+
+    Attributes:
+        path: Directory of the store.
+        offsets: Array of shape (n_reports, 2 * n_sections) with the start and end byte offsets of each section.
+
+    """
+    sections = ("report", "impression", "electronic_signature")
+    texts_filename = "texts.bin"
+    offsets_filename = "offsets.npy"
+
+    def __init__(self, path: str | Path) -> None:
+        """Opens an existing store.
+
+        Args:
+            path: Directory of the store, created with `build`.
+
+        """
+        self.path = Path(path).resolve()
+        self.offsets = np.load(self.path / self.offsets_filename, mmap_mode="r")
+
+        # Views returned by get_bytes that are still alive. They are released when the store is closed, because the
+        # mapping can't be closed while they exist
+        self._views = weakref.WeakSet()
+
+        self._file = open(self.path / self.texts_filename, "rb")
+        # A file of size 0 can't be memory-mapped
+        if self.offsets.size and self.offsets.max() > 0:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buffer = b""
+
+    @classmethod
+    def build(cls, reports: list[Report], path: str | Path) -> TextStore:
+        """Writes the texts of the reports into a new store.
+
+        Args:
+            reports: Reports to store.
+            path: Directory of the store. It will be created if it doesn't exist.
+
+        Returns:
+            The opened store.
+
+        """
+        path = Path(path).resolve()
+        path.mkdir(parents=True, exist_ok=True)
+
+        offsets = np.zeros((len(reports), 2 * len(cls.sections)), dtype=np.int64)
+        position = 0
+        with open(path / cls.texts_filename, "wb") as f:
+            for i, report in enumerate(reports):
+                tokens = report.text.split()
+                # Byte offset where each token starts, taking into account the space between tokens
+                token_sizes = np.array([len(x.encode("utf-8")) for x in tokens], dtype=np.int64)
+                token_starts = position + np.concatenate([[0], np.cumsum(token_sizes + 1)])
+
+                spans = [(0, len(tokens)), Report.get_impression_span(tokens),
+                         Report.get_electronic_signature_span(tokens)]
+                for j, (start, end) in enumerate(spans):
+                    if end > start:
+                        offsets[i, 2 * j] = token_starts[start]
+                        offsets[i, 2 * j + 1] = token_starts[end] - 1
+                    else:
+                        offsets[i, 2 * j] = offsets[i, 2 * j + 1] = position
+
+                data = " ".join(tokens).encode("utf-8")
+                f.write(data)
+                position += len(data)
+
+        np.save(path / cls.offsets_filename, offsets)
+
+        return cls(path)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def get_bytes(self, i: int, look_in: str = "report") -> memoryview:
+        """Gets a section of a report without copying it.
+
+        Args:
+            i: Position of the report.
+            look_in: Section to get. Either "report", "impression" or "electronic_signature".
+
+        Returns:
+            A read-only view of the UTF-8 bytes of the section. It is released when the store is closed, so it must be
+            copied (e.g. with `bytes`) to use it afterwards. Views sliced from it are not tracked and must be released
+            by the caller before closing the store.
+
+        """
+        if look_in not in self.sections:
+            raise ValueError(f"look_in must be one of {self.sections}")
+
+        j = self.sections.index(look_in)
+        start, end = self.offsets[i, 2 * j], self.offsets[i, 2 * j + 1]
+
+        view = memoryview(self._buffer)[start:end]
+        self._views.add(view)
+
+        return view
+
+    def get_text(self, i: int, look_in: str = "report") -> str:
+        """Gets and decodes a section of a report.
+
+        Args:
+            i: Position of the report.
+            look_in: Section to get. Either "report", "impression" or "electronic_signature".
+
+        Returns:
+            The text of the section.
+
+        """
+        with self.get_bytes(i, look_in) as view:
+            return str(view, "utf-8")
+
+    def get_texts(self, look_in: str = "report", positions: list[int] | np.ndarray | None = None) -> list[str]:
+        """Gets and decodes a section of many reports.
+
+        Args:
+            look_in: Section to get. Either "report", "impression" or "electronic_signature".
+            positions: Positions of the reports. If None, all the reports are returned.
+
+        Returns:
+            A list with the texts of the section.
+
+        """
+        if positions is None:
+            positions = range(len(self))
+
+        return [self.get_text(i, look_in) for i in positions]
+
+    def close(self) -> None:
+        """Releases the views returned by get_bytes and closes the memory mapping and the underlying file."""
+        for view in list(self._views):
+            view.release()
+
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._file.close()
+
+    def __enter__(self) -> TextStore:
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __getstate__(self) -> dict:
+        # Only the path is sent to other processes, which open their own mapping of the same file
+        return {"path": self.path}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["path"])
+
+
+if __name__ == '__main__':
+    from src.data_preparation.loaders import load_reports
+
+    reports_ = load_reports("src/data_preparation/data/merged_crosswalks_csv/sdr_crosswalks.csv")
+
+    with TextStore.build(reports_, "src/data_preparation/data/text_store") as store:
+        impression = store.get_text(0, "impression")
@@ -0,0 +1,87 @@
+"""This module scores the pathology labels against the tokens of the reports with fuzzy matching, so that misspelled
+pathologies are found without the cost of a partial ratio over the whole text of each report.
+
+The vocabulary of the corpus is deduplicated first and each distinct token is scored against each label only once.
+The score of a label in a report is then the maximum score of its tokens, computed with vectorized reductions over
+the indices of the tokens in the vocabulary. Labels with several words are scored against the n-grams of the report
+with the same number of words.
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from src.label_compiler import LemmaCache, normalize_text
+
+
+class TokenFuzzyScorer:
+    """Scores the labels against the tokens of many texts at once.
+
+    Attributes:
+        labels: Pathology labels.
+        lemma_cache: Cache used to lemmatize the labels and the texts. If None, tokens are not lemmatized.
+        batch_size: Number of texts whose token scores are reduced at the same time, to bound the memory.
+
+    """
+    def __init__(self, labels: list[str], lemma_cache: LemmaCache | None = None, batch_size: int = 1000) -> None:
+        """Initializes a TokenFuzzyScorer object."""
+        self.labels = labels
+        self.lemma_cache = lemma_cache
+        self.batch_size = batch_size
+
+        label_tokens = self._normalize(labels)
+        self._label_strings = [" ".join(x) for x in label_tokens]
+
+        # Positions of the labels grouped by their number of words
+        self._labels_by_length = {}
+        for i, tokens in enumerate(label_tokens):
+            if tokens:
+                self._labels_by_length.setdefault(len(tokens), []).append(i)
+
+    def score(self, texts: list[str]) -> np.ndarray:
+        """Computes the fuzzy score of each label in each text.
+
+        Args:
+            texts: Texts to look in.
+
+        Returns:
+            An array of shape (n_texts, n_labels) with the highest fuzzy ratio (0-100) between each label and the
+            n-grams of each text.
+
+        """
+        docs = self._normalize(texts)
+        scores = np.zeros((len(texts), len(self.labels)), dtype=np.float32)
+
+        for n, label_positions in self._labels_by_length.items():
+            # N-grams of all the texts one after the other, with the number of n-grams of each text
+            ngrams = [" ".join(doc[i:i + n]) for doc in docs for i in range(len(doc) - n + 1)]
+            counts = np.array([max(len(doc) - n + 1, 0) for doc in docs], dtype=np.int64)
+            if not ngrams:
+                continue
+
+            # Each distinct n-gram is scored only once
+            ngram_idx, vocab = pd.factorize(pd.Series(ngrams, dtype=object))
+            vocab_scores = process.cdist(vocab.tolist(), [self._label_strings[i] for i in label_positions],
+                                         scorer=fuzz.ratio, dtype=np.float32, workers=-1)
+
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            for batch_start in range(0, len(docs), self.batch_size):
+                batch = np.arange(batch_start, min(batch_start + self.batch_size, len(docs)))
+                batch = batch[counts[batch] > 0]
+                if not len(batch):
+                    continue
+
+                first, last = starts[batch[0]], starts[batch[-1]] + counts[batch[-1]]
+                batch_scores = vocab_scores[ngram_idx[first:last]]
+                scores[np.ix_(batch, label_positions)] = np.maximum.reduceat(batch_scores, starts[batch] - first, axis=0)
+
+        return scores
+
+    def _normalize(self, texts: list[str]) -> list[list[str]]:
+        """Splits the texts into normalized (and lemmatized, if there is a lemma cache) tokens."""
+        docs = [normalize_text(x) for x in texts]
+        if self.lemma_cache is not None:
+            docs = self.lemma_cache.lemmatize_many(docs)
+
+        return docs